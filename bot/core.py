@@ -15,47 +15,307 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
 import logging
+from importlib import import_module
 from os import environ
-from typing import Any, Type, Union, cast
+from time import perf_counter, time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
+from aiocron import crontab  # type: ignore
 from aiohttp import ClientSession
-from discord import Game, Guild, Intents, Interaction, Message, Role, Status
-from discord.ext.commands import Bot, Context  # type: ignore
-from discord.utils import cached_property, setup_logging
-from jishaku.modules import find_extensions_in
-from sqlalchemy.ext.asyncio import create_async_engine
+from discord import Game, Guild, Interaction, Message, Role, Status
+from discord.ext.commands import AutoShardedBot, Context  # type: ignore
+from discord.utils import MISSING, cached_property, setup_logging
+from psutil import Process
 
+from bot.utils.cache import Cache
 from bot.utils.constants import BOOSTER_ROLE_ID, GUILD_ID
 from bot.utils.context import IContext
-from bot.utils.database import DB_URL
+from bot.utils.database import create_engine
+from bot.utils.extensions import filter_extensions, find_extensions
+from bot.utils.intents import get_intents, get_member_cache_flags
+from bot.utils.metrics import LagMonitor, Metrics, StartupProfiler
+from bot.utils.pool import InstrumentedPool
+from bot.utils.profiler import QueryProfiler
+from bot.utils.prometheus import MetricsServer
+from bot.utils.resolver import UserResolver
+from bot.utils.settings import (
+    DIAGNOSTICS_LAG_INTERVAL,
+    DIAGNOSTICS_SLOW_QUERY_MS,
+    DISCORD_INTENTS,
+    DISCORD_MAX_MESSAGES,
+    DISCORD_MEMBER_CACHE,
+    EXTENSIONS_ALLOW,
+    EXTENSIONS_DENY,
+    METRICS_HOST,
+    USERS_CACHE_SIZE,
+    USERS_CACHE_TTL,
+    USERS_FETCH_CONCURRENCY,
+)
 
 environ["JISHAKU_NO_UNDERSCORE"] = "true"
 environ["JISHAKU_NO_DM_TRACEBACK"] = "true"
 
 log = logging.getLogger(__name__)
 
+# The name of the histogram of the event loop lag.
+LOOP_LAG = "loop lag"
+# The name of the histogram of the database queries.
+DATABASE_QUERY = "database query"
 
-class IBot(Bot):
-    """Main bot class. The magic happens here."""
 
-    def __init__(self) -> None:
+class IBot(AutoShardedBot):
+    """Main bot class. The magic happens here.
+
+    Parameters
+    ----------
+    shard_count: Optional[:class:`int`]
+        The total amount of shards. If this is not given, then Discord
+        decides it. Defaults to ``None``.
+    shard_ids: Optional[List[:class:`int`]]
+        The shards run by this process, when the shards are split
+        between many processes. Defaults to ``None``, which runs every
+        shard.
+    metrics_port: :class:`int`
+        The port the metrics are served on. Defaults to ``0``, which
+        doesn't serve them.
+    """
+
+    def __init__(
+        self,
+        *,
+        shard_count: Optional[int] = None,
+        shard_ids: Optional[List[int]] = None,
+        metrics_port: int = 0,
+    ) -> None:
+        extensions = filter_extensions(
+            find_extensions("bot/extensions"),
+            allow=EXTENSIONS_ALLOW,
+            deny=EXTENSIONS_DENY,
+        )
+        # The extensions are imported before anything else, so the
+        # time of each import includes the dependencies it brings in.
+        self.startup = StartupProfiler()
+
+        for extension in extensions:
+            with self.startup.measure(f"import {extension}"):
+                import_module(extension)
+
         super().__init__(
             command_prefix=get_prefix,
-            intents=Intents.all(),
+            intents=get_intents(extensions, profile=DISCORD_INTENTS),
+            member_cache_flags=get_member_cache_flags(DISCORD_MEMBER_CACHE),
+            # discord.py falls back to its default when this is zero.
+            max_messages=DISCORD_MAX_MESSAGES or None,
             activity=Game(name="discord.gg/incandescent"),
             status=Status.dnd,
+            shard_count=shard_count,
+            shard_ids=shard_ids,
         )
 
+        self.initial_extensions = extensions
+
         self.default_prefix = "in?" if self.env == "development" else "in!"
-        self.engine = create_async_engine(DB_URL)
+        self.engine = create_engine()
         self.session = ClientSession()
+        # Caches registered by the extensions, reported by the
+        # diagnostics commands.
+        self.caches: Dict[str, Cache] = {}
+
+        self.resolver = UserResolver(
+            self,
+            ttl=USERS_CACHE_TTL,
+            max_size=USERS_CACHE_SIZE,
+            concurrency=USERS_FETCH_CONCURRENCY,
+        )
+        self.caches["users"] = self.resolver.users
+
+        # Every listener and command is timed, so the handlers that
+        # stall the event loop can be found.
+        self.metrics = Metrics()
+        self.lag_monitor = LagMonitor(
+            self.metrics.get(LOOP_LAG), interval=DIAGNOSTICS_LAG_INTERVAL
+        )
+        self.query_profiler = QueryProfiler(
+            self.metrics.get(DATABASE_QUERY),
+            slow_threshold=DIAGNOSTICS_SLOW_QUERY_MS / 1000,
+        )
+        self.query_profiler.attach(self.engine)
+        self.metrics_port = metrics_port
+        # The periodic logs are only started by ``setup_hook``, so
+        # closing a bot that never started has nothing to stop.
+        self.pool_task = crontab(  # type: ignore
+            "*/5 * * * *",
+            func=self.log_pool_stats,
+            start=False,
+        )
+        self.metrics_task = crontab(  # type: ignore
+            "*/5 * * * *",
+            func=self.log_metrics,
+            start=False,
+        )
+        self.metrics_server = MetricsServer(
+            self, host=METRICS_HOST, port=metrics_port
+        )
+        # A mapping of the listeners added to the bot to their wrappers,
+        # so they can be removed later.
+        self.instrumented: Dict[Tuple[Callable[..., Any], str], Any] = {}
+
+        self.before_invoke(self.start_command_timer)
+        self.after_invoke(self.stop_command_timer)
 
         setup_logging()
 
     async def setup_hook(self) -> None:
-        for extension in find_extensions_in("bot/extensions"):
-            await self.load_extension(extension)
+        # The extensions are loaded one at a time, in order, so their
+        # commands and listeners are always registered in the same
+        # order, and a failure stops the startup before anything else
+        # is loaded, naming the extension that failed.
+        with self.startup.measure("load extensions"):
+            for extension in self.initial_extensions:
+                await self.load_extension_timed(extension)
+
+        self.pool_task.start()  # type: ignore
+        self.metrics_task.start()  # type: ignore
+        self.lag_monitor.start()
+
+        if self.metrics_port:
+            await self.metrics_server.start()
+
+    async def load_extension_timed(self, name: str) -> None:
+        with self.startup.measure(f"load {name}"):
+            await self.load_extension(name)
+
+    async def log_pool_stats(self) -> None:
+        stats = self.db_pool.get_stats()
+        log.info(
+            "Database pool: %s",
+            ", ".join(f"{key}={value}" for key, value in stats.items()),
+        )
+
+    async def log_metrics(self) -> None:
+        lag = self.metrics.get(LOOP_LAG).get_stats()
+        handlers = sorted(
+            (
+                (name, histogram)
+                for name, histogram in self.metrics.histograms.items()
+                if name != LOOP_LAG
+            ),
+            key=lambda item: item[1].get_percentile(95),
+            reverse=True,
+        )
+        slowest = ", ".join(
+            f"{name} (p95_ms={histogram.get_stats()['p95_ms']}, "
+            f"errors={histogram.errors})"
+            for name, histogram in handlers[:5]
+        )
+
+        log.info(
+            "Event loop lag: %s. Slowest handlers: %s",
+            ", ".join(f"{key}={value}" for key, value in lag.items()),
+            slowest or "none",
+        )
+
+    def add_listener(
+        self, func: Callable[..., Any], /, name: str = MISSING
+    ) -> None:
+        name = func.__name__ if name is MISSING else name
+
+        # Anything else is rejected by discord.py below.
+        if asyncio.iscoroutinefunction(func):
+            wrapper = self.metrics.instrument(
+                func, f"listener {func.__qualname__}"
+            )
+            self.instrumented[(func, name)] = wrapper
+            func = wrapper
+
+        super().add_listener(func, name)
+
+    def remove_listener(
+        self, func: Callable[..., Any], /, name: str = MISSING
+    ) -> None:
+        name = func.__name__ if name is MISSING else name
+        wrapper = self.instrumented.pop((func, name), func)
+
+        super().remove_listener(wrapper, name)
+
+    async def start_command_timer(self, ctx: IContext) -> None:
+        ctx.started_at = perf_counter()
+
+    async def stop_command_timer(self, ctx: IContext) -> None:
+        if ctx.command is None or ctx.started_at is None:
+            return
+
+        name = f"command {ctx.command.qualified_name}"
+        histogram = self.metrics.get(name)
+        histogram.observe(perf_counter() - ctx.started_at)
+
+        if ctx.command_failed:
+            histogram.errors += 1
+
+    async def on_ready(self) -> None:
+        # The bot is ready again after reconnecting, but only the first
+        # time counts for the startup.
+        if "ready" not in self.startup.steps:
+            self.startup.record("ready", time() - Process().create_time())
+            log.info(
+                "Startup: %s",
+                ", ".join(
+                    f"{step}={value}ms"
+                    for step, value in self.startup.get_stats().items()
+                ),
+            )
+
+        stats = self.get_memory_stats()
+        log.info(
+            "Memory usage: %s",
+            ", ".join(f"{key}={value}" for key, value in stats.items()),
+        )
+
+    def get_memory_stats(self) -> Dict[str, float]:
+        """Gets the resident memory of the process and the size of the
+        caches of the bot.
+
+        Returns
+        -------
+        Dict[:class:`str`, :class:`float`]
+            A mapping of each statistic name to its value.
+        """
+        stats: Dict[str, float] = {
+            "rss_mib": round(Process().memory_info().rss / 1024**2, 1),
+            "guilds": len(self.guilds),
+            "users": len(self.users),
+            "members": sum(len(guild.members) for guild in self.guilds),
+            "messages": len(self.cached_messages),
+        }
+
+        for name, cache in self.caches.items():
+            stats[f"{name}_cache"] = len(cache)
+
+        return stats
+
+    async def close(self) -> None:
+        # Closing the bot unloads every extension first, so anything
+        # they still hold in memory is flushed before the engine goes
+        # away.
+        await super().close()
+        self.pool_task.stop()  # type: ignore
+        self.metrics_task.stop()  # type: ignore
+        await self.lag_monitor.close()
+        await self.metrics_server.close()
+        await self.session.close()
+        await self.engine.dispose()
 
     async def get_context(
         self,
@@ -66,6 +326,23 @@ class IBot(Bot):
     ) -> Any:
         return await super().get_context(origin, cls=cls)
 
+    @property
+    def db_pool(self) -> InstrumentedPool:
+        return cast(InstrumentedPool, self.engine.pool)
+
+    @property
+    def owns_guild(self) -> bool:
+        """Whether the guild is in one of the shards of this process.
+        The events of a guild are only sent to a single shard, so the
+        extensions that keep state about the guild are only loaded by
+        the process that owns it. This keeps a single writer for that
+        state when the bot runs in many processes.
+        """
+        if self.shard_ids is None or self.shard_count is None:
+            return True
+
+        return (GUILD_ID >> 22) % self.shard_count in self.shard_ids
+
     @cached_property
     def guild(self) -> Guild:
         return cast(Guild, self.get_guild(GUILD_ID))
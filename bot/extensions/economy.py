@@ -15,25 +15,53 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import logging
+from collections import Counter
+from contextlib import suppress
+from datetime import datetime
+from math import ceil
 from random import randint
-from typing import cast
-
-from discord import Member
-from discord.ext.commands import (  # type: ignore
-    Author,
-    BucketType,
-    Cog,
-    cooldown,
-    hybrid_command,
-)
+from typing import Any, Dict, List, Optional, cast
+
+from discord import Intents, Member, Message
+from discord.ext.commands import Author, Cog, hybrid_command  # type: ignore
 from humanize import intcomma
 from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import insert  # type: ignore
 
 from bot.core import IBot
-from bot.utils.constants import INCANDECOIN_EMOTE
+from bot.utils.batch import BatchWriter
+from bot.utils.cache import TTLCache
+from bot.utils.constants import INCANDECOIN_EMOTE, LEADERBOARD_PAGE_SIZE
 from bot.utils.context import IContext
+from bot.utils.cooldowns import DatabaseCooldownStore, MemoryCooldownStore
 from bot.utils.database import EconomyUser
+from bot.utils.embed import create_embed
+from bot.utils.ranking import Ranking
+from bot.utils.settings import (
+    COOLDOWNS_SWEEP_INTERVAL,
+    ECONOMY_BATCH_SIZE,
+    ECONOMY_CACHE_SIZE,
+    ECONOMY_CACHE_TTL,
+    ECONOMY_FLUSH_INTERVAL,
+    ECONOMY_MAX_PENDING,
+    ECONOMY_MESSAGE_REWARD,
+    ECONOMY_RANKING_REFRESH_INTERVAL,
+    ECONOMY_RANKING_SIZE,
+    ECONOMY_WRITE_RETRIES,
+)
+from bot.utils.statements import (
+    INSERT_TRANSACTIONS,
+    SELECT_BALANCE,
+    TRANSFER_COINS,
+    UPSERT_BALANCES,
+    UPSERT_COINS,
+)
+
+log = logging.getLogger(__name__)
+
+# The balance command looks up the given member.
+INTENTS = Intents(members=True)
 
 
 class Economy(Cog, name="Economia"):
@@ -43,8 +71,148 @@ class Economy(Cog, name="Economia"):
 
     def __init__(self, bot: IBot) -> None:
         self.bot = bot
+        # The daily cooldown is kept in the database, so restarting the
+        # bot doesn't let everyone claim it again.
+        self.daily_cooldown = DatabaseCooldownStore(bot.engine, "daily", 86400)
+        self.message_cooldown = MemoryCooldownStore(
+            60, sweep_interval=COOLDOWNS_SWEEP_INTERVAL
+        )
+        # Frequent grants, such as the chatting reward, are written in
+        # batches, so each one doesn't cost a transaction.
+        self.grants: BatchWriter[Dict[str, Any]] = BatchWriter(
+            self.write_grants,
+            max_size=ECONOMY_BATCH_SIZE,
+            max_delay=ECONOMY_FLUSH_INTERVAL,
+            max_pending=ECONOMY_MAX_PENDING,
+            retries=ECONOMY_WRITE_RETRIES,
+        )
+        # Reads are cached, and every write invalidates the cached
+        # balance instead of replacing it: concurrent writes to the same
+        # user can get here in a different order than they committed,
+        # so the balance they return may already be stale.
+        self.balances: TTLCache[int, int] = TTLCache(
+            ttl=ECONOMY_CACHE_TTL, max_size=ECONOMY_CACHE_SIZE
+        )
+        # The amount of writes so far. A read that raced with a write
+        # may have read the balance from before it, so it isn't cached.
+        self.balance_writes = 0
+        # A snapshot of the richest users, reloaded periodically and
+        # updated in between as balances change.
+        self.ranking = Ranking()
+        # The balances changed while the ranking is being reloaded,
+        # which are applied again once it's loaded.
+        self.ranking_writes: Optional[Dict[int, int]] = None
+
+    async def cog_load(self) -> None:
+        await self.refresh_ranking()
+
+        self.message_cooldown.start()
+        self.grants.start()
+        self.ranking_task = asyncio.create_task(self.run_ranking_refresh())
+        self.bot.caches["balances"] = self.balances
+
+    async def cog_unload(self) -> None:
+        self.bot.caches.pop("balances", None)
+        self.ranking_task.cancel()
+
+        with suppress(asyncio.CancelledError):
+            await self.ranking_task
+
+        await self.message_cooldown.close()
+        await self.grants.close()
+
+    async def refresh_ranking(self) -> None:
+        """Reloads the richest users into the ranking. This reads only
+        the first entries of the balance index.
+        """
+        self.ranking_writes = {}
+
+        try:
+            async with self.bot.engine.begin() as conn:
+                stmt = (
+                    select(EconomyUser.user_id, EconomyUser.balance)
+                    .where(EconomyUser.balance > 0)
+                    .order_by(EconomyUser.balance.desc())
+                    .limit(ECONOMY_RANKING_SIZE)
+                )
+                result = await conn.execute(stmt)
+
+            self.ranking.load(dict(result.tuples().all()))
+
+            for user_id, balance in self.ranking_writes.items():
+                self.update_ranking(user_id, balance)
+        finally:
+            self.ranking_writes = None
+
+    async def run_ranking_refresh(self) -> None:
+        while True:
+            await asyncio.sleep(ECONOMY_RANKING_REFRESH_INTERVAL)
+
+            try:
+                await self.refresh_ranking()
+            except Exception:
+                log.exception("Failed to refresh the economy ranking")
+
+    def update_ranking(self, user_id: int, balance: int) -> None:
+        if balance <= 0:
+            self.ranking.remove(user_id)
+            return
+
+        # Only the richest users are kept, so a user that doesn't beat
+        # the last one is dropped right after being added.
+        self.ranking.update(user_id, balance)
+        self.ranking.trim(ECONOMY_RANKING_SIZE)
+
+    def store_balance(self, user_id: int, balance: int) -> None:
+        """Invalidates the cached balance of a user after it was written
+        to the database, and updates the ranking with the new balance.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user.
+        balance: :class:`int`
+            The new balance of the user.
+        """
+        self.balances.pop(user_id)
+        self.balance_writes += 1
+        self.update_ranking(user_id, balance)
+
+        if self.ranking_writes is not None:
+            self.ranking_writes[user_id] = balance
+
+    async def get_balance(self, user_id: int) -> int:
+        """Gets the balance of a user, from the cache if possible.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user.
+
+        Returns
+        -------
+        :class:`int`
+            The balance of the user, or zero if they don't have one.
+        """
+        balance = self.balances.get(user_id)
 
-    async def add_coins(self, user_id: int, to_add: int) -> int:
+        if balance is not None:
+            return balance
+
+        writes = self.balance_writes
+
+        async with self.bot.engine.begin() as conn:
+            params = dict(user_id=user_id)
+            result = (await conn.execute(SELECT_BALANCE, params)).fetchone()
+
+        balance = result.balance if result is not None else 0
+
+        if writes == self.balance_writes:
+            self.balances.add(user_id, balance)
+
+        return balance
+
+    async def add_coins(self, user_id: int, to_add: int, reason: str) -> int:
         """Adds the given amount of coins to the given user's balance.
         If the user does not exist in the database, they will be
         inserted with the given amount of coins.
@@ -55,28 +223,134 @@ class Economy(Cog, name="Economia"):
             The ID of the user to add coins to.
         to_add: :class:`int`
             The amount of coins to add to the user's balance.
+        reason: :class:`str`
+            Why the coins were added, for the transaction history.
 
         Returns
         -------
         :class:`int`
             The user's new balance.
         """
+        params = dict(user_id=user_id, amount=to_add)
+        transaction = dict(
+            receiver_id=user_id,
+            amount=to_add,
+            reason=reason,
+            created_at=datetime.utcnow(),
+        )
+
         async with self.bot.engine.begin() as conn:
-            stmt = (
-                insert(EconomyUser)  # type: ignore
-                .values(user_id=user_id, balance=to_add)
-                .on_conflict_do_update(
-                    index_elements=[EconomyUser.user_id],
-                    set_=dict(balance=EconomyUser.balance + to_add),
-                )
-                .returning(EconomyUser.balance)
-            )
-            result = (await conn.execute(stmt)).fetchone()
+            result = (await conn.execute(UPSERT_COINS, params)).fetchone()
+            await conn.execute(INSERT_TRANSACTIONS, transaction)
+
+        balance = result.balance if result is not None else to_add
+        self.store_balance(user_id, balance)
+
+        return balance
 
-        return result.balance if result is not None else to_add
+    async def grant_coins(
+        self, user_id: int, amount: int, reason: str
+    ) -> None:
+        """Grants coins to a user in the background. The grant is
+        written in the next batch, so the balance of the user is only
+        updated a few seconds later.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user to grant coins to.
+        amount: :class:`int`
+            The amount of coins to grant.
+        reason: :class:`str`
+            Why the coins were granted, for the transaction history.
+        """
+        row = dict(
+            receiver_id=user_id,
+            amount=amount,
+            reason=reason,
+            created_at=datetime.utcnow(),
+        )
+        await self.grants.put(row)
+
+    async def write_grants(self, rows: List[Dict[str, Any]]) -> None:
+        """Writes a batch of grants to the database. The grants of each
+        user are summed up into a single balance update, and the
+        transactions are inserted in the same database transaction.
+
+        Parameters
+        ----------
+        rows: List[Dict[:class:`str`, Any]]
+            The transactions to write, as column-value mappings.
+        """
+        totals: Counter[int] = Counter()
+
+        for row in rows:
+            totals[row["receiver_id"]] += row["amount"]
+
+        # The rows are locked in the order of the user IDs, like the
+        # transfers lock them, so the two can't deadlock each other.
+        user_ids = sorted(totals)
+        params = dict(user_ids=user_ids, amounts=[totals[i] for i in user_ids])
+
+        async with self.bot.engine.begin() as conn:
+            result = await conn.execute(UPSERT_BALANCES, params)
+            await conn.execute(INSERT_TRANSACTIONS, rows)
+
+        for user_id, balance in result:
+            self.store_balance(user_id, balance)
+
+    async def transfer_coins(
+        self, sender_id: int, receiver_id: int, amount: int
+    ) -> Optional[int]:
+        """Transfers coins between two users atomically. The transfer
+        only happens if the sender has enough coins.
+
+        Parameters
+        ----------
+        sender_id: :class:`int`
+            The ID of the user that sends the coins.
+        receiver_id: :class:`int`
+            The ID of the user that receives the coins.
+        amount: :class:`int`
+            The amount of coins to transfer.
+
+        Returns
+        -------
+        Optional[:class:`int`]
+            The new balance of the sender, or ``None`` if they don't
+            have enough coins.
+        """
+        params = dict(
+            sender_id=sender_id,
+            receiver_id=receiver_id,
+            amount=amount,
+            reason="transfer",
+        )
+
+        async with self.bot.engine.begin() as conn:
+            result = (await conn.execute(TRANSFER_COINS, params)).fetchone()
+
+        if result is None:
+            return None
+
+        self.store_balance(sender_id, result.sender_balance)
+        self.store_balance(receiver_id, result.receiver_balance)
+
+        return result.sender_balance
+
+    @Cog.listener()
+    async def on_regular_message(self, message: Message) -> None:
+        if ECONOMY_MESSAGE_REWARD <= 0:
+            return
+
+        author_id = message.author.id
+
+        if await self.message_cooldown.acquire(author_id) is not None:
+            return
+
+        await self.grant_coins(author_id, ECONOMY_MESSAGE_REWARD, "message")
 
     @hybrid_command()
-    @cooldown(1, 86400, BucketType.user)
     async def daily(self, ctx: IContext) -> None:
         """Receba seus incandecoins diários."""
         author = cast(Member, ctx.author)
@@ -84,25 +358,75 @@ class Economy(Cog, name="Economia"):
         interval = (150, 375) if ctx.is_booster() else (100, 150)
         to_add = randint(*interval)
 
-        await self.add_coins(author.id, to_add)
+        await self.add_coins(author.id, to_add, "daily")
         await ctx.reply(
             f"{author.mention} recebeu **{to_add} {INCANDECOIN_EMOTE}**!"
         )
 
+    @daily.before_invoke
+    async def check_daily(self, ctx: IContext) -> None:
+        # This runs after the checks, so the help command doesn't claim
+        # the cooldown when it checks whether the command can be used.
+        await self.daily_cooldown.check(ctx.author.id)
+
     @hybrid_command(aliases=["bal"], usage="[membro]")
     async def balance(self, ctx: IContext, *, member: Member = Author) -> None:
         """Veja a sua balança ou a balança de outro membro."""
-        async with self.bot.engine.begin() as conn:
-            stmt = select(EconomyUser.balance).where(
-                EconomyUser.user_id == member.id
-            )
-            result = (await conn.execute(stmt)).fetchone()
-
-        coins = result.balance if result is not None else 0
+        coins = await self.get_balance(member.id)
         amount = f"{intcomma(coins)} {INCANDECOIN_EMOTE}"
 
         await ctx.reply(f"{member.mention} tem **{amount}**.")
 
+    @hybrid_command(usage="<membro> <quantidade>")
+    async def pay(
+        self, ctx: IContext, member: Member, amount: int
+    ) -> Optional[Message]:
+        """Transfira incandecoins para outro membro."""
+        if member.bot or member.id == ctx.author.id:
+            return await ctx.reply(
+                "Você não pode transferir incandecoins para este membro."
+            )
+
+        if amount <= 0:
+            return await ctx.reply(
+                "A quantidade de incandecoins deve ser maior que zero."
+            )
+
+        balance = await self.transfer_coins(ctx.author.id, member.id, amount)
+
+        if balance is None:
+            return await ctx.reply("Você não tem incandecoins suficientes.")
+
+        coins = f"{intcomma(amount)} {INCANDECOIN_EMOTE}"
+        await ctx.reply(
+            f"{ctx.author.mention} transferiu **{coins}** para "
+            f"{member.mention}."
+        )
+
+    @hybrid_command(usage="[página]")
+    async def top(self, ctx: IContext, page: int = 1) -> Optional[Message]:
+        """Mostra os membros com mais incandecoins."""
+        entries = self.ranking.get_page(page, per_page=LEADERBOARD_PAGE_SIZE)
+
+        if page <= 0 or not entries:
+            return await ctx.reply("Essa página não existe.")
+
+        start = (page - 1) * LEADERBOARD_PAGE_SIZE + 1
+        contents = [
+            f"**{position}.** <@{user_id}> "
+            f"({intcomma(balance)} {INCANDECOIN_EMOTE})"
+            for position, (user_id, balance) in enumerate(entries, start)
+        ]
+
+        pages = ceil(len(self.ranking) / LEADERBOARD_PAGE_SIZE)
+
+        embed = create_embed("\n".join(contents), author=ctx.author)
+        embed.title = "Ranking de incandecoins"
+        embed.set_footer(text=f"Página {page} de {pages}")
+
+        await ctx.reply(embed=embed)
+
 
 async def setup(bot: IBot) -> None:
-    await bot.add_cog(Economy(bot))
+    if bot.owns_guild:
+        await bot.add_cog(Economy(bot))
@@ -15,19 +15,65 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
+import logging
+from collections import Counter
+from datetime import datetime
 from io import BytesIO
-from typing import cast
+from time import perf_counter
+from typing import Any, Dict, List, Optional, cast
 
-from discord import File, Member, Message, TextChannel
+from aiocron import crontab  # type: ignore
+from discord import (
+    Asset,
+    DefaultAvatar,
+    File,
+    Intents,
+    Member,
+    Message,
+    TextChannel,
+)
 from discord.ext.commands import Cog  # type: ignore
 from discord.utils import cached_property
-from PIL import Image, ImageDraw
-from sqlalchemy import insert
 
 from bot.core import IBot
+from bot.utils.batch import BatchWriter
+from bot.utils.cache import LRUCache
 from bot.utils.constants import GENERAL_CHANNEL_ID, WELCOME_EMOTE
 from bot.utils.database import DiscordMessage
 from bot.utils.embed import create_embed
+from bot.utils.formats import human_join
+from bot.utils.partitions import (
+    add_months,
+    create_monthly_partitions,
+    drop_partitions,
+    get_expired_partitions,
+)
+from bot.utils.settings import (
+    MESSAGES_BATCH_SIZE,
+    MESSAGES_FLUSH_INTERVAL,
+    MESSAGES_MAX_PENDING,
+    MESSAGES_PARTITIONS_AHEAD,
+    MESSAGES_RETENTION_MONTHS,
+    WELCOME_BURST_WINDOW,
+    WELCOME_CACHE_BYTES,
+    WELCOME_COMPRESS_LEVEL,
+    WELCOME_FORMAT,
+    WELCOME_MAX_PENDING,
+    WELCOME_QUALITY,
+    WELCOME_RENDER_WORKERS,
+)
+from bot.utils.statements import INSERT_MESSAGES, UPSERT_MESSAGE_COUNTS
+from bot.utils.welcome import WelcomeCard
+
+log = logging.getLogger(__name__)
+
+# The maximum amount of files attached to a single message.
+MAX_ATTACHMENTS = 10
+
+# Messages are logged with their content, and joining members are
+# welcomed.
+INTENTS = Intents(guild_messages=True, message_content=True, members=True)
 
 
 class Events(Cog):
@@ -35,18 +81,115 @@ class Events(Cog):
 
     def __init__(self, bot: IBot) -> None:
         self.bot = bot
+        # Messages are written to the database in the background, so
+        # the dispatch of ``regular_message`` never waits on a commit.
+        self.writer: BatchWriter[Dict[str, Any]] = BatchWriter(
+            self.write_messages,
+            max_size=MESSAGES_BATCH_SIZE,
+            max_delay=MESSAGES_FLUSH_INTERVAL,
+            max_pending=MESSAGES_MAX_PENDING,
+        )
+        self.task = crontab(  # type: ignore
+            "0 3 * * *",
+            func=self.maintain_partitions,
+            start=False,
+        )
+
+        if bot.env == "production":
+            self.task.start()  # type: ignore
+
+        self.card = WelcomeCard(
+            "bot/assets/welcome.png",
+            workers=WELCOME_RENDER_WORKERS,
+            format=WELCOME_FORMAT,
+            quality=WELCOME_QUALITY,
+            compress_level=WELCOME_COMPRESS_LEVEL,
+        )
+        # Rendered cards, keyed by the avatar they were rendered from.
+        self.cards = LRUCache(WELCOME_CACHE_BYTES)
+        # Members that join within a short window are welcomed together
+        # in a single message, so raids don't flood the channel.
+        self.welcomes: BatchWriter[Member] = BatchWriter(
+            self.send_welcome,
+            max_size=MAX_ATTACHMENTS,
+            max_delay=WELCOME_BURST_WINDOW,
+            max_pending=WELCOME_MAX_PENDING,
+        )
 
-        with open("bot/assets/welcome.png", "rb") as f:
-            self.welcome_bytes = BytesIO(f.read())
+    async def cog_load(self) -> None:
+        # The partitions are checked right away as well, so messages can
+        # be logged even if the bot was offline when the task last ran.
+        await self.maintain_partitions()
+        self.writer.start()
+        self.welcomes.start()
 
-        self.size = (500, 500)
-        self.coords = (208, 257)
+        self.bot.caches["welcome_cards"] = self.cards
+        self.prerender = asyncio.create_task(self.render_default_cards())
 
-        self.mask = Image.new("L", self.size, 0)
-        self.background = Image.new("RGBA", self.size, 0)
+    async def cog_unload(self) -> None:
+        self.bot.caches.pop("welcome_cards", None)
+        self.prerender.cancel()
+        self.task.stop()  # type: ignore
+        await self.writer.close()
+        await self.welcomes.close()
+        self.card.close()
 
-        draw = ImageDraw.Draw(self.mask)
-        draw.ellipse((4, 4, self.size[0] - 4, self.size[1] - 4), fill=255)
+    async def maintain_partitions(self) -> None:
+        """Creates the partitions of the messages table for the next
+        months and drops the ones past the retention window.
+        """
+        today = datetime.utcnow().date()
+
+        async with self.bot.engine.begin() as conn:
+            await create_monthly_partitions(
+                conn,
+                DiscordMessage.__tablename__,
+                start=today,
+                months=MESSAGES_PARTITIONS_AHEAD + 1,
+            )
+
+            if MESSAGES_RETENTION_MONTHS <= 0:
+                return
+
+            before = add_months(today, -MESSAGES_RETENTION_MONTHS)
+            expired = await get_expired_partitions(
+                conn, DiscordMessage.__tablename__, before=before
+            )
+
+            if not expired:
+                return
+
+            # The messages in these partitions are gone for good, so
+            # they're logged before anything is dropped.
+            log.warning(
+                "Dropping message partitions older than %s: %s",
+                before,
+                ", ".join(expired),
+            )
+            await drop_partitions(conn, DiscordMessage.__tablename__, expired)
+
+    async def write_messages(self, rows: List[Dict[str, Any]]) -> None:
+        """Writes a batch of messages to the database in a single
+        statement, and adds them to the daily message counts in the
+        same transaction.
+
+        Parameters
+        ----------
+        rows: List[Dict[:class:`str`, Any]]
+            The messages to write, as column-value mappings.
+        """
+        counts = Counter(
+            (row["created_at"].date(), row["author_id"]) for row in rows
+        )
+        params = dict(
+            days=[day for day, _ in counts],
+            author_ids=[author_id for _, author_id in counts],
+            counts=list(counts.values()),
+        )
+
+        async with self.bot.engine.begin() as conn:
+            await conn.execute(INSERT_MESSAGES, rows)
+            await conn.execute(UPSERT_MESSAGE_COUNTS, params)
 
     @cached_property
     def general_channel(self) -> TextChannel:
@@ -63,46 +206,154 @@ class Events(Cog):
         if message.author.bot:
             return
 
-        async with self.bot.engine.begin() as conn:
-            stmt = insert(DiscordMessage).values(
-                message_id=message.id,
-                author_id=message.author.id,
-                channel_id=message.channel.id,
-                content=message.content,
-                created_at=message.created_at.replace(tzinfo=None),
-            )
-            await conn.execute(stmt)
+        row = dict(
+            message_id=message.id,
+            author_id=message.author.id,
+            channel_id=message.channel.id,
+            content=message.content,
+            created_at=message.created_at.replace(tzinfo=None),
+        )
+        await self.writer.put(row)
+        self.bot.metrics.increment("messages processed")
 
         self.bot.dispatch("regular_message", message)
 
-    @Cog.listener()
-    async def on_member_join(self, member: Member) -> None:
-        welcome = Image.open(self.welcome_bytes)
-        output = BytesIO()
+    async def get_card(self, member: Member) -> Optional[bytes]:
+        """Gets the welcome card of a member, downloading their avatar
+        and rendering it unless it's cached. If that fails, the card of
+        their default avatar is used instead, so one broken avatar
+        doesn't keep the others in a burst from being welcomed.
+
+        Parameters
+        ----------
+        member: :class:`discord.Member`
+            The member to get the card for.
+
+        Returns
+        -------
+        Optional[:class:`bytes`]
+            The rendered card, or ``None`` if neither the card of the
+            member nor the card of their default avatar is available.
+        """
+        avatar = member.display_avatar
+        card = self.cards.get(avatar.key)
+
+        if card is not None:
+            return card
+
+        try:
+            asset = avatar.replace(
+                size=self.card.avatar_size, static_format="png"
+            )
+            card = await self.render_card(await asset.read())
+        except Exception:
+            log.exception("Failed to render the welcome card of %s", member)
+            return self.cards.get(member.default_avatar.key)
+
+        self.cards.set(avatar.key, card)
+        return card
+
+    async def create_welcome_file(
+        self, member: Member, name: str
+    ) -> Optional[File]:
+        """Creates the file with the welcome card of a member.
+
+        Parameters
+        ----------
+        member: :class:`discord.Member`
+            The member to render the card for.
+        name: :class:`str`
+            The filename of the card.
+
+        Returns
+        -------
+        Optional[:class:`discord.File`]
+            The rendered card, or ``None`` if no card is available.
+        """
+        card = await self.get_card(member)
+
+        if card is None:
+            return None
+
+        return File(BytesIO(card), filename=name)
 
-        async with self.bot.session.get(member.display_avatar.url) as res:
-            image_bytes = BytesIO(await res.read())
+    async def render_card(self, avatar: bytes) -> bytes:
+        """Renders a welcome card, recording how long it took.
 
-        avatar = Image.open(image_bytes).resize(self.size)
+        Parameters
+        ----------
+        avatar: :class:`bytes`
+            The avatar to render the card with.
 
-        rounded = Image.composite(avatar, self.background, self.mask)
-        welcome.paste(rounded, box=self.coords, mask=self.mask)
+        Returns
+        -------
+        :class:`bytes`
+            The rendered card.
+        """
+        start = perf_counter()
+        card = await self.card.render_async(avatar)
+        self.bot.metrics.get("welcome render").observe(perf_counter() - start)
 
-        welcome.save(output, format="PNG")
-        output.seek(0)
+        return card
 
-        content = (
-            f"Olá, {member.mention}! Seja bem-vindo(a) ao **Incandescent "
-            f"Society**! Esperamos que você se divirta bastante aqui."
+    async def render_default_cards(self) -> None:
+        """Renders the cards of the default avatars ahead of time, since
+        many new accounts don't have an avatar.
+        """
+        for avatar in DefaultAvatar:
+            url = f"{Asset.BASE}/embed/avatars/{avatar.value}.png"
+
+            async with self.bot.session.get(url) as res:
+                data = await res.read()
+
+            card = await self.render_card(data)
+            self.cards.set(str(avatar.value), card)
+
+    async def send_welcome(self, members: List[Member]) -> None:
+        """Sends a single welcome message for the given members.
+
+        Parameters
+        ----------
+        members: List[:class:`discord.Member`]
+            The members to welcome.
+        """
+        mentions = human_join([member.mention for member in members])
+        ext = self.card.format
+
+        results = await asyncio.gather(
+            *(
+                self.create_welcome_file(member, f"welcome-{idx}.{ext}")
+                for idx, member in enumerate(members)
+            )
         )
+        files = [file for file in results if file is not None]
+
+        if len(members) == 1:
+            title = "Seja bem-vindo(a)!"
+            content = (
+                f"Olá, {mentions}! Seja bem-vindo(a) ao **Incandescent "
+                f"Society**! Esperamos que você se divirta bastante aqui."
+            )
+        else:
+            title = "Sejam bem-vindos(as)!"
+            content = (
+                f"Olá, {mentions}! Sejam bem-vindos(as) ao **Incandescent "
+                f"Society**! Esperamos que vocês se divirtam bastante aqui."
+            )
 
         embed = create_embed(content)
-        embed.title = f"Seja bem-vindo(a)! {WELCOME_EMOTE}"
-        embed.set_image(url="attachment://welcome.png")
+        embed.title = f"{title} {WELCOME_EMOTE}"
+
+        if files:
+            embed.set_image(url=f"attachment://{files[0].filename}")
 
-        file = File(output, filename="welcome.png")
-        await self.general_channel.send(member.mention, file=file, embed=embed)
+        await self.general_channel.send(mentions, files=files, embed=embed)
+
+    @Cog.listener()
+    async def on_member_join(self, member: Member) -> None:
+        await self.welcomes.put(member)
 
 
 async def setup(bot: IBot) -> None:
-    await bot.add_cog(Events(bot))
+    if bot.owns_guild:
+        await bot.add_cog(Events(bot))
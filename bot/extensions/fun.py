@@ -15,10 +15,10 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from typing import List, Union, cast
+from typing import List, cast
 
 from aiocron import crontab  # type: ignore
-from discord import Member, Role, TextChannel, User
+from discord import Intents, Member, Role, TextChannel
 from discord.ext.commands import Cog  # type: ignore
 from discord.utils import cached_property
 from humanize import intcomma
@@ -26,8 +26,13 @@ from sqlalchemy import func, select, text
 
 from bot.core import IBot
 from bot.utils.constants import CHATTY_CHANNEL_ID, CHATTY_ROLE_ID
-from bot.utils.database import DiscordMessage
+from bot.utils.database import MessageCount
 from bot.utils.embed import create_embed
+from bot.utils.roles import bulk_sync_roles, sync_roles
+from bot.utils.settings import ROLES_SYNC_CONCURRENCY
+
+# The chatty ranking reads the members of the chatty role.
+INTENTS = Intents(members=True)
 
 
 class Fun(Cog):
@@ -52,48 +57,38 @@ class Fun(Cog):
     def chatty_role(self) -> Role:
         return cast(Role, self.bot.guild.get_role(CHATTY_ROLE_ID))
 
-    async def getch_member(self, user_id: int) -> Union[Member, User]:
-        """Get a user from the guild, fetching it as an user if
-        necessary.
-
-        Parameters
-        ----------
-        user_id: :class:`int`
-            The user ID to get the member from.
-
-        Returns
-        -------
-        :class:`discord.Member`
-            The member from the guild.
-        """
-        member = self.bot.guild.get_member(user_id)
-
-        if member is None:
-            member = await self.bot.fetch_user(user_id)
-
-        return member
-
     async def chatty_event(self) -> None:
         members: List[str] = []
 
+        # The ranking is read from the daily message counts, which are
+        # kept up to date as messages are logged, so this reads at most
+        # seven rows per active author instead of every message.
         async with self.bot.engine.begin() as conn:
-            count = func.count().label("count")
-            interval = text("CURRENT_TIMESTAMP - INTERVAL '7 DAYS'")
+            count = func.sum(MessageCount.count).label("count")
+            interval = text("CURRENT_DATE - 7")
 
             stmt = (
-                select(DiscordMessage.author_id, count)
-                .where(DiscordMessage.created_at > interval)
-                .group_by(DiscordMessage.author_id)
+                select(MessageCount.author_id, count)
+                .where(MessageCount.day > interval)
+                .group_by(MessageCount.author_id)
                 .order_by(count.desc())
                 .limit(10)
             )
             result = (await conn.execute(stmt)).all()
 
-        for idx, row in enumerate(result, start=1):
-            member = await self.getch_member(row[0])
-            total = intcomma(row[1])
+        # Authors that left the guild are fetched concurrently, and
+        # shown by name since they can't be mentioned anymore.
+        users = await self.bot.resolver.resolve_many(row[0] for row in result)
+
+        for idx, (author_id, total) in enumerate(result, start=1):
+            user = users[author_id]
+
+            if user is None or isinstance(user, Member):
+                name = f"<@{author_id}>"
+            else:
+                name = f"**{user}**"
 
-            content = f"**{idx}.** {member.mention} ({total} mensagens)"
+            content = f"**{idx}.** {name} ({intcomma(total)} mensagens)"
             members.append(content)
 
         member_id, total = result[0]
@@ -106,11 +101,17 @@ class Fun(Cog):
         )
         ranking = "\n".join(members)
 
-        for member in self.chatty_role.members:
-            # They don't deserve the role anymore...
-            await member.remove_roles(self.chatty_role)
-
-        await chatty.add_roles(self.chatty_role)
+        # They don't deserve the role anymore...
+        await bulk_sync_roles(
+            [
+                member
+                for member in self.chatty_role.members
+                if member != chatty
+            ],
+            remove=[self.chatty_role],
+            concurrency=ROLES_SYNC_CONCURRENCY,
+        )
+        await sync_roles(chatty, add=[self.chatty_role])
 
         embed = create_embed(f"{content}\n\n{ranking}")
         embed.title = "\U0001f4e2 Ranking de mensagens semanal"
@@ -119,4 +120,5 @@ class Fun(Cog):
 
 
 async def setup(bot: IBot) -> None:
-    await bot.add_cog(Fun(bot))
+    if bot.owns_guild:
+        await bot.add_cog(Fun(bot))
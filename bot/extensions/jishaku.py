@@ -15,6 +15,11 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from textwrap import shorten
+from typing import List
+
+from discord import Intents
+from jishaku.features.baseclass import Feature
 from jishaku.features.filesystem import FilesystemFeature
 from jishaku.features.guild import GuildFeature
 from jishaku.features.invocation import InvocationFeature
@@ -24,10 +29,128 @@ from jishaku.features.root_command import RootCommand
 from jishaku.features.shell import ShellFeature
 from jishaku.features.voice import VoiceFeature
 
-from bot.core import IBot
+from bot.core import LOOP_LAG, IBot
+from bot.utils.context import IContext
+
+# The voice commands join the voice channel of the author, and
+# discord.py can't connect to voice without the voice states.
+INTENTS = Intents(voice_states=True)
+
+# The most characters in the description of an embed, where the replies
+# of the diagnostics commands are shown.
+MAX_LENGTH = 4096
+
+
+def codeblock(lines: List[str]) -> str:
+    """Joins the given lines into a code block, for the diagnostics
+    commands. The lines that don't fit in a reply are left out, so the
+    block is always closed.
+    """
+    # The fences, the newlines around the lines and the marker of the
+    # lines left out.
+    size = len("```\n\n```\n...")
+    kept: List[str] = []
+
+    for line in lines:
+        size += len(line) + 1
+
+        if size > MAX_LENGTH:
+            kept.append("...")
+            break
+
+        kept.append(line)
+
+    return "```\n" + ("\n".join(kept) or "-") + "\n```"
+
+
+class DiagnosticsFeature(Feature):
+    """Feature with commands to inspect the internals of the bot."""
+
+    @Feature.Command(parent="jsk", name="pool")
+    async def jsk_pool(self, ctx: IContext) -> None:
+        """Shows the state and metrics of the database pool."""
+        stats = ctx.bot.db_pool.get_stats()
+        lines = [f"{key}: {value}" for key, value in stats.items()]
+
+        await ctx.reply(codeblock(lines))
+
+    @Feature.Command(parent="jsk", name="cache")
+    async def jsk_cache(self, ctx: IContext) -> None:
+        """Shows the size and hit ratio of the caches of the bot."""
+        lines: List[str] = []
+
+        for name, cache in ctx.bot.caches.items():
+            stats = cache.get_stats().items()
+            lines.append(f"{name}: " + ", ".join(f"{k}={v}" for k, v in stats))
+
+        await ctx.reply(codeblock(lines))
+
+    @Feature.Command(parent="jsk", name="metrics")
+    async def jsk_metrics(self, ctx: IContext, limit: int = 10) -> None:
+        """Shows the latency and errors of the slowest listeners and
+        commands, and the lag of the event loop.
+        """
+        metrics = ctx.bot.metrics
+        handlers = sorted(
+            (
+                (name, histogram)
+                for name, histogram in metrics.histograms.items()
+                if name != LOOP_LAG
+            ),
+            key=lambda item: item[1].get_percentile(95),
+            reverse=True,
+        )
+        # The lag of the event loop is always shown first, followed by
+        # the slowest handlers only, so the reply fits in an embed.
+        histograms = [(LOOP_LAG, metrics.get(LOOP_LAG)), *handlers[:limit]]
+        lines: List[str] = []
+
+        for name, histogram in histograms:
+            stats = histogram.get_stats().items()
+            lines.append(f"{name}: " + ", ".join(f"{k}={v}" for k, v in stats))
+
+        await ctx.reply(codeblock(lines))
+
+    @Feature.Command(parent="jsk", name="startup")
+    async def jsk_startup(self, ctx: IContext) -> None:
+        """Shows how long each step of the startup took, such as
+        importing and loading each extension.
+        """
+        stats = ctx.bot.startup.get_stats().items()
+        lines = [f"{step}: {value} ms" for step, value in stats]
+
+        await ctx.reply(codeblock(lines))
+
+    @Feature.Command(parent="jsk", name="queries")
+    async def jsk_queries(self, ctx: IContext, limit: int = 10) -> None:
+        """Shows the queries that took the most time of the database."""
+        lines: List[str] = []
+
+        for query in ctx.bot.query_profiler.get_top(limit):
+            stats = query.get_stats().items()
+            lines.append(
+                f"{query.key}: " + ", ".join(f"{k}={v}" for k, v in stats)
+            )
+            lines.append(f"  {shorten(query.statement, 150)}")
+
+        await ctx.reply(codeblock(lines))
+
+    @Feature.Command(parent="jsk", name="explain")
+    async def jsk_explain(self, ctx: IContext, key: str) -> None:
+        """Shows the plan of the slowest run of a query, given its key
+        from ``jsk queries``.
+        """
+        try:
+            lines = await ctx.bot.query_profiler.explain(ctx.bot.engine, key)
+        except KeyError:
+            await ctx.reply("There is no query with that key to explain.")
+            return
+
+        await ctx.reply(codeblock(lines))
 
 
 class Jishaku(
+    DiagnosticsFeature,
     VoiceFeature,
     GuildFeature,
     FilesystemFeature,
@@ -15,29 +15,40 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from math import ceil
 from random import randint
-from typing import Dict, Optional, cast
+from typing import Dict, List, Optional, cast
 
-from discord import Member, Message, Role, TextChannel
+from discord import Intents, Member, Message, Role, TextChannel
 from discord.ext.commands import (  # type: ignore
     Author,
-    BucketType,
     Cog,
-    CooldownMapping,
     Greedy,
     hybrid_group,
     is_owner,
 )
 from humanize import intcomma
-from sqlalchemy import delete, select
-from sqlalchemy.dialects.postgresql import insert  # type: ignore
 
 from bot.core import IBot
-from bot.utils.constants import LEVELS_MAPPING, TEST_CHANNEL_ID
+from bot.utils.constants import (
+    LEADERBOARD_PAGE_SIZE,
+    LEVELS_MAPPING,
+    TEST_CHANNEL_ID,
+)
 from bot.utils.context import IContext
-from bot.utils.database import LevelUser
+from bot.utils.cooldowns import MemoryCooldownStore
 from bot.utils.embed import create_embed
 from bot.utils.formats import human_join
+from bot.utils.levels import ExperienceStore, LevelCurve
+from bot.utils.roles import sync_roles
+from bot.utils.settings import (
+    COOLDOWNS_SWEEP_INTERVAL,
+    LEVELS_FLUSH_INTERVAL,
+    LEVELS_FLUSH_THRESHOLD,
+)
+
+# Messages award experience, and members that leave lose it.
+INTENTS = Intents(guild_messages=True, members=True)
 
 
 class Levels(Cog, name="Ranking"):
@@ -50,7 +61,28 @@ class Levels(Cog, name="Ranking"):
         # Users can only gain experience once every minute. This is
         # because we don't want users to spam messages to gain
         # experience.
-        self.cooldown = CooldownMapping.from_cooldown(1, 60, BucketType.user)
+        self.cooldown = MemoryCooldownStore(
+            60, sweep_interval=COOLDOWNS_SWEEP_INTERVAL
+        )
+        # The experience curve converts experience to levels without
+        # walking the levels one at a time.
+        self.curve = LevelCurve()
+        # The experience of every user lives in memory, and the changes
+        # are written back to the database periodically.
+        self.store = ExperienceStore(
+            bot.engine,
+            flush_interval=LEVELS_FLUSH_INTERVAL,
+            flush_threshold=LEVELS_FLUSH_THRESHOLD,
+        )
+
+    async def cog_load(self) -> None:
+        await self.store.load()
+        self.store.start()
+        self.cooldown.start()
+
+    async def cog_unload(self) -> None:
+        await self.cooldown.close()
+        await self.store.close()
 
     def get_level_exp(self, level: int) -> int:
         """Get the experience required to reach the given level. The
@@ -71,7 +103,7 @@ class Levels(Cog, name="Ranking"):
         :class:`int`
             The experience required to reach the given level.
         """
-        return 5 * (level**2) + (50 * level) + 100
+        return self.curve.get_level_exp(level)
 
     def get_level_from_exp(self, exp: int) -> int:
         """Get the level from the given experience.
@@ -86,66 +118,29 @@ class Levels(Cog, name="Ranking"):
         :class:`int`
             The level from the given experience.
         """
-        level = 0
+        return self.curve.get_level(exp)
 
-        while exp >= self.get_level_exp(level):
-            exp -= self.get_level_exp(level)
-            level += 1
-
-        return level
-
-    async def insert_user(self, user_id: int) -> None:
-        """Inserts a user into the database with zero experience. This
-        should only be used when the user sends a message and doesn't
-        exist in the database.
-
-        Parameters
-        ----------
-        user_id: :class:`int`
-            The ID of the user to insert into the database.
-        """
-        async with self.bot.engine.begin() as conn:
-            stmt = insert(LevelUser).values(user_id=user_id)
-            await conn.execute(stmt)
-
-    async def get_experience(
-        self,
-        user_id: int,
-        *,
-        insert: bool = False,
-    ) -> int:
-        """Gets the experience of a user. If the user doesn't exist in
-        the database, then zero is returned. If the ``insert`` parameter
-        is set to ``True``, then the user will be inserted into the
-        database if they don't exist.
+    def get_experience(self, user_id: int) -> int:
+        """Gets the experience of a user. If the user doesn't have any
+        experience yet, then zero is returned.
 
         Parameters
         ----------
         user_id: :class:`int`
             The ID of the user to get the experience of.
-        insert: :class:`bool`
-            Whether to insert the user into the database if they don't
-            exist. Defaults to ``False``.
 
         Returns
         -------
         :class:`int`
             The experience of the user, or zero if the user doesn't
-            exist in the database.
+            have any experience yet.
         """
-        async with self.bot.engine.begin() as conn:
-            stmt = select(LevelUser).where(LevelUser.user_id == user_id)
-            result = (await conn.execute(stmt)).fetchone()
-
-        if result is None and insert:
-            await self.insert_user(user_id)
-
-        return result.exp if result is not None else 0
+        return self.store.get(user_id)
 
-    async def add_experience(self, user_id: int, to_add: int) -> int:
-        """Adds experience to a user and returns the new experience. If
-        the user doesn't exist in the database, then they will be
-        inserted with the given amount of experience.
+    def add_experience(self, user_id: int, to_add: int) -> int:
+        """Adds experience to a user and returns the new experience. The
+        change is written to the database on the next flush of the
+        experience store.
 
         Parameters
         ----------
@@ -159,24 +154,14 @@ class Levels(Cog, name="Ranking"):
         :class:`int`
             The new experience of the user.
         """
-        async with self.bot.engine.begin() as conn:
-            stmt = (
-                insert(LevelUser)  # type: ignore
-                .values(user_id=user_id, exp=to_add)
-                .on_conflict_do_update(
-                    index_elements=[LevelUser.user_id],
-                    set_=dict(exp=LevelUser.exp + to_add),
-                )
-                .returning(LevelUser.exp)
-            )
-            result = (await conn.execute(stmt)).fetchone()
+        return self.store.add(user_id, to_add)
 
-        return result.exp if result is not None else to_add
-
-    async def bulk_add_experience(self, *user_ids: int, to_add: int) -> None:
-        """Adds experience to multiple users. This is more efficient
-        than calling :meth:`add_experience` multiple times as it only
-        makes one query.
+    async def bulk_add_experience(
+        self, *user_ids: int, to_add: int
+    ) -> Dict[int, int]:
+        """Adds experience to multiple users and writes the changes to
+        the database right away, in a single statement no matter how
+        many users are given.
 
         Parameters
         ----------
@@ -184,21 +169,24 @@ class Levels(Cog, name="Ranking"):
             The IDs of the users to add experience to.
         to_add: :class:`int`
             The amount of experience to add.
+
+        Returns
+        -------
+        Dict[:class:`int`, :class:`int`]
+            A mapping of each user ID to their new experience.
         """
-        async with self.bot.engine.begin() as conn:
-            for user_id in user_ids:
-                stmt = (
-                    insert(LevelUser)  # type: ignore
-                    .values(user_id=user_id, exp=to_add)
-                    .on_conflict_do_update(
-                        index_elements=[LevelUser.user_id],
-                        set_=dict(exp=LevelUser.exp + to_add),
-                    )
-                )
-                await conn.execute(stmt)
+        for user_id in user_ids:
+            self.store.add(user_id, to_add)
 
-    async def bulk_set_experience(self, *user_ids: int, to_set: int) -> None:
-        """Sets the experience of multiple users.
+        await self.store.flush()
+        return {user_id: self.store.get(user_id) for user_id in user_ids}
+
+    async def bulk_set_experience(
+        self, *user_ids: int, to_set: int
+    ) -> Dict[int, int]:
+        """Sets the experience of multiple users and writes the changes
+        to the database right away, in a single statement no matter how
+        many users are given.
 
         Parameters
         ----------
@@ -206,18 +194,17 @@ class Levels(Cog, name="Ranking"):
             The IDs of the users to set the experience of.
         exp: :class:`int`
             The amount of experience to set.
+
+        Returns
+        -------
+        Dict[:class:`int`, :class:`int`]
+            A mapping of each user ID to their new experience.
         """
-        async with self.bot.engine.begin() as conn:
-            for user_id in user_ids:
-                stmt = (
-                    insert(LevelUser)  # type: ignore
-                    .values(user_id=user_id, exp=to_set)
-                    .on_conflict_do_update(
-                        index_elements=[LevelUser.user_id],
-                        set_=dict(exp=to_set),
-                    )
-                )
-                await conn.execute(stmt)
+        for user_id in user_ids:
+            self.store.set(user_id, to_set)
+
+        await self.store.flush()
+        return {user_id: to_set for user_id in user_ids}
 
     def draw_experience_bar(self, exp: int, *, width: int = 20) -> str:
         """Draws an experience bar for the given experience.
@@ -237,7 +224,7 @@ class Levels(Cog, name="Ranking"):
         level = self.get_level_from_exp(exp)
         needed_exp = self.get_level_exp(level)
 
-        exp -= sum(self.get_level_exp(i) for i in range(level))
+        exp -= self.curve.get_total_exp(level)
         amount = round((exp / needed_exp) * 100)
 
         filled = "█" * round(width * (amount / 100))
@@ -260,9 +247,7 @@ class Levels(Cog, name="Ranking"):
     async def on_member_remove(self, member: Member) -> None:
         # If a member leaves the server, then we delete their entry in
         # the database so that they don't take up space.
-        async with self.bot.engine.begin() as conn:
-            stmt = delete(LevelUser).where(LevelUser.user_id == member.id)
-            await conn.execute(stmt)
+        await self.store.delete(member.id)
 
     @Cog.listener()
     async def on_regular_message(self, message: Message) -> None:
@@ -274,24 +259,26 @@ class Levels(Cog, name="Ranking"):
         if self.bot.env == "development" and channel.id != TEST_CHANNEL_ID:
             return
 
-        current_exp = await self.get_experience(author.id, insert=True)
-        current_level = self.get_level_from_exp(current_exp)
-
-        bucket = self.cooldown.get_bucket(message)
-        retry_after = bucket.update_rate_limit() if bucket else None
-
-        if retry_after is not None:
+        # The cooldown is checked before touching the database, so
+        # messages that don't award experience cost no queries at all.
+        if await self.cooldown.acquire(author.id) is not None:
             return
 
-        new_exp = await self.add_experience(author.id, randint(15, 25))
+        # The previous experience is derived from the new one, so the
+        # whole award is a single update of the experience store.
+        to_add = randint(15, 25)
+        new_exp = self.add_experience(author.id, to_add)
+        self.bot.metrics.increment("experience awards")
+
+        current_level = self.get_level_from_exp(new_exp - to_add)
         new_level = self.get_level_from_exp(new_exp)
 
         # If the new level is different from the current level, then
         # the user has leveled up, so we reply to the message with an
         # embed to notify the user. If the new level is in the level
-        # mapping, then we remove all the roles in the mapping from the
-        # user (so that the user only has one level role at a time) and
-        # add the new level role to the user.
+        # mapping, then we replace all the roles in the mapping the user
+        # has with the new level role (so that the user only has one
+        # level role at a time), in a single request.
         if new_level != current_level:
             contents = [
                 f"Parabéns, {author.mention}! Você subiu para o "
@@ -308,8 +295,9 @@ class Levels(Cog, name="Ranking"):
                     f"para esse nível."
                 )
 
-                await author.remove_roles(*self.mapping.values())
-                await author.add_roles(role)
+                await sync_roles(
+                    author, add=[role], remove=self.mapping.values()
+                )
 
             embed = create_embed("\n".join(contents), author=author)
             await message.reply(embed=embed, mention_author=False)
@@ -319,12 +307,17 @@ class Levels(Cog, name="Ranking"):
     @hybrid_group(fallback="info", usage="[membro]")
     async def exp(self, ctx: IContext, member: Member = Author) -> None:
         """Informações sobre a experiência do usuário."""
-        exp = await self.get_experience(member.id)
+        exp = self.get_experience(member.id)
         level = self.get_level_from_exp(exp)
+        # Users without any experience aren't in the ranking, so they
+        # are placed right after everyone else.
+        ranking = self.store.ranking
+        position = ranking.get_position(member.id) or len(ranking) + 1
 
         contents = [
             f"**Nível:** {intcomma(level)}",
             f"**Experiência:** {intcomma(exp)}",
+            f"**Posição:** #{intcomma(position)}",
             self.draw_experience_bar(exp),
         ]
 
@@ -335,6 +328,33 @@ class Levels(Cog, name="Ranking"):
 
         await ctx.reply(embed=embed)
 
+    @exp.command(name="top", usage="[página]")
+    async def exp_top(self, ctx: IContext, page: int = 1) -> Optional[Message]:
+        """Mostra os usuários com mais experiência."""
+        ranking = self.store.ranking
+        entries = ranking.get_page(page, per_page=LEADERBOARD_PAGE_SIZE)
+
+        if page <= 0 or not entries:
+            return await ctx.reply("Essa página não existe.")
+
+        start = (page - 1) * LEADERBOARD_PAGE_SIZE + 1
+        contents: List[str] = []
+
+        for position, (user_id, exp) in enumerate(entries, start=start):
+            level = intcomma(self.get_level_from_exp(exp))
+            contents.append(
+                f"**{position}.** <@{user_id}> (nível {level}, "
+                f"{intcomma(exp)} de experiência)"
+            )
+
+        pages = ceil(len(ranking) / LEADERBOARD_PAGE_SIZE)
+
+        embed = create_embed("\n".join(contents), author=ctx.author)
+        embed.title = "Ranking de experiência"
+        embed.set_footer(text=f"Página {page} de {pages}")
+
+        await ctx.reply(embed=embed)
+
     @exp.command(name="add", usage="<usuários...> <quantidade>")
     @is_owner()
     async def exp_add(
@@ -418,4 +438,5 @@ class Levels(Cog, name="Ranking"):
 
 
 async def setup(bot: IBot) -> None:
-    await bot.add_cog(Levels(bot))
+    if bot.owns_guild:
+        await bot.add_cog(Levels(bot))
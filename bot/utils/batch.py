@@ -0,0 +1,175 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Awaitable, Callable, Generic, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+log = logging.getLogger(__name__)
+
+
+class BatchWriter(Generic[T]):
+    """A write-behind buffer. Items are collected in memory and handed
+    to ``flush`` in batches, so callers don't have to wait for the
+    database on every single item.
+
+    A batch is flushed when it reaches ``max_size`` items or when
+    ``max_delay`` seconds have passed since its first item. Only one
+    batch is flushed at a time, so when the database is slow the queue
+    fills up and :meth:`put` starts waiting (backpressure) instead of
+    growing the memory usage without bound.
+
+    Parameters
+    ----------
+    flush: Callable[[List[T]], Awaitable[None]]
+        The coroutine function that writes a batch of items.
+    max_size: :class:`int`
+        The maximum amount of items in a single batch.
+    max_delay: :class:`float`
+        The maximum amount of seconds an item waits before its batch is
+        flushed.
+    max_pending: :class:`int`
+        The maximum amount of items waiting in the queue.
+    retries: :class:`int`
+        How many times a batch that failed to be written is retried
+        before its items are given up on. The delay between the
+        attempts starts at ``retry_delay`` seconds and doubles after
+        each one. Defaults to ``0``.
+    retry_delay: :class:`float`
+        The seconds before the first retry. Defaults to ``1``.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[T]], Awaitable[None]],
+        *,
+        max_size: int,
+        max_delay: float,
+        max_pending: int,
+        retries: int = 0,
+        retry_delay: float = 1,
+    ) -> None:
+        self.flush = flush
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        self.queue: asyncio.Queue[T] = asyncio.Queue(max_pending)
+        self.batch: List[T] = []
+
+        self.task: Optional[asyncio.Task[None]] = None
+        self.writing: Optional[asyncio.Future[None]] = None
+
+    def start(self) -> None:
+        """Starts the background task that flushes the batches. This
+        must be called from a running event loop.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def put(self, item: T) -> None:
+        """Adds an item to the queue. This only waits if the queue is
+        full, that is, if the database can't keep up.
+
+        Parameters
+        ----------
+        item: T
+            The item to add to the queue.
+        """
+        await self.queue.put(item)
+
+    async def close(self) -> None:
+        """Stops the background task and flushes everything that is
+        still in memory. No item that was put before this call is lost.
+        """
+        if self.task is not None:
+            self.task.cancel()
+
+            with suppress(asyncio.CancelledError):
+                await self.task
+
+            self.task = None
+
+        if self.writing is not None:
+            await self.writing
+
+        self.drain(self.queue.qsize())
+
+        while self.batch:
+            batch = self.batch[: self.max_size]
+            del self.batch[: self.max_size]
+
+            await self.write(batch)
+
+    def drain(self, limit: int) -> None:
+        """Moves up to ``limit`` items from the queue to the current
+        batch without waiting.
+        """
+        for _ in range(min(limit, self.queue.qsize())):
+            self.batch.append(self.queue.get_nowait())
+
+    async def collect(self) -> None:
+        """Waits until the current batch is full or its time is up."""
+        self.batch.append(await self.queue.get())
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+
+        while len(self.batch) < self.max_size:
+            self.drain(self.max_size - len(self.batch))
+            timeout = deadline - loop.time()
+
+            if len(self.batch) >= self.max_size or timeout <= 0:
+                break
+
+            with suppress(TimeoutError):
+                async with asyncio.timeout(timeout):
+                    self.batch.append(await self.queue.get())
+
+    async def write(self, batch: List[T]) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                await self.flush(batch)
+                return
+            except Exception:
+                log.exception(
+                    "Failed to flush a batch of %d items", len(batch)
+                )
+
+            # While a batch is retried, no other batch is written, so
+            # the queue fills up and the callers wait, as when the
+            # database is slow.
+            if attempt < self.retries:
+                await asyncio.sleep(self.retry_delay * 2**attempt)
+
+        # The items are logged, so they can still be recovered by hand.
+        log.error("Gave up on a batch of %d items: %r", len(batch), batch)
+
+    async def run(self) -> None:
+        while True:
+            await self.collect()
+            batch, self.batch = self.batch, []
+
+            # The write is shielded so that closing the writer in the
+            # middle of a flush doesn't abort it halfway.
+            self.writing = asyncio.ensure_future(self.write(batch))
+            await asyncio.shield(self.writing)
+            self.writing = None
@@ -0,0 +1,252 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class Cache(ABC):
+    """Base class for the caches of the bot. This keeps the hit and
+    miss counters, which are reported by the diagnostics commands.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Gets the amount of entries in the cache."""
+
+    def record(self, hit: bool) -> None:
+        """Records a lookup.
+
+        Parameters
+        ----------
+        hit: :class:`bool`
+            Whether the lookup found the value in the cache.
+        """
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Gets the statistics of the cache.
+
+        Returns
+        -------
+        Dict[:class:`str`, :class:`float`]
+            A mapping of each statistic name to its value.
+        """
+        lookups = self.hits + self.misses
+
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0,
+        }
+
+
+class LRUCache(Cache):
+    """A least recently used cache of bytes. The cache is bounded by
+    the total size of its values instead of the amount of entries, so
+    its memory usage is known up front.
+
+    Parameters
+    ----------
+    max_bytes: :class:`int`
+        The maximum total size of the values in the cache.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        super().__init__()
+
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Gets a value from the cache, marking it as recently used.
+
+        Parameters
+        ----------
+        key: :class:`str`
+            The key of the value.
+
+        Returns
+        -------
+        Optional[:class:`bytes`]
+            The value, or ``None`` if it isn't in the cache.
+        """
+        value = self.entries.get(key)
+        self.record(value is not None)
+
+        if value is not None:
+            self.entries.move_to_end(key)
+
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        """Adds a value to the cache, evicting the least recently used
+        values until it fits. Values larger than the whole cache are
+        not stored.
+
+        Parameters
+        ----------
+        key: :class:`str`
+            The key of the value.
+        value: :class:`bytes`
+            The value to store.
+        """
+        self.pop(key)
+
+        if len(value) > self.max_bytes:
+            return
+
+        while self.size + len(value) > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+        self.entries[key] = value
+        self.size += len(value)
+
+    def pop(self, key: str) -> None:
+        """Removes a value from the cache, if it is there.
+
+        Parameters
+        ----------
+        key: :class:`str`
+            The key of the value.
+        """
+        value = self.entries.pop(key, None)
+
+        if value is not None:
+            self.size -= len(value)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {
+            **super().get_stats(),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
+
+
+class TTLCache(Cache, Generic[K, V]):
+    """A cache whose values expire ``ttl`` seconds after being set. The
+    cache holds at most ``max_size`` values, evicting the oldest ones
+    first when it's full.
+
+    Parameters
+    ----------
+    ttl: :class:`float`
+        The amount of seconds a value is cached.
+    max_size: :class:`int`
+        The maximum amount of values in the cache.
+    """
+
+    def __init__(self, *, ttl: float, max_size: int) -> None:
+        super().__init__()
+
+        self.ttl = ttl
+        self.max_size = max_size
+        # A mapping of keys to when they expire and their value.
+        self.entries: Dict[K, Tuple[float, V]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Gets a value from the cache, if it hasn't expired.
+
+        Parameters
+        ----------
+        key: K
+            The key of the value.
+        default: Optional[V]
+            The value returned if the key isn't in the cache. Defaults
+            to ``None``.
+
+        Returns
+        -------
+        Optional[V]
+            The value, or ``default`` if it isn't in the cache.
+        """
+        entry = self.entries.get(key)
+        hit = entry is not None and entry[0] > monotonic()
+        self.record(hit)
+
+        return entry[1] if entry is not None and hit else default
+
+    def set(self, key: K, value: V) -> None:
+        """Adds a value to the cache, replacing the current one.
+
+        Parameters
+        ----------
+        key: K
+            The key of the value.
+        value: V
+            The value to store.
+        """
+        # Entries are kept in insertion order, so the oldest ones are
+        # evicted first when the cache is full.
+        self.entries.pop(key, None)
+
+        while len(self.entries) >= self.max_size:
+            del self.entries[next(iter(self.entries))]
+
+        self.entries[key] = (monotonic() + self.ttl, value)
+
+    def add(self, key: K, value: V) -> None:
+        """Adds a value to the cache, unless it already has a value for
+        the key that hasn't expired. This is used to store values read
+        from the database, so a read that finishes after a concurrent
+        write doesn't replace the newer value.
+
+        Parameters
+        ----------
+        key: K
+            The key of the value.
+        value: V
+            The value to store.
+        """
+        entry = self.entries.get(key)
+
+        if entry is None or entry[0] <= monotonic():
+            self.set(key, value)
+
+    def pop(self, key: K) -> None:
+        """Removes a value from the cache, if it is there.
+
+        Parameters
+        ----------
+        key: K
+            The key of the value.
+        """
+        self.entries.pop(key, None)
+
+    def get_stats(self) -> Dict[str, float]:
+        return {**super().get_stats(), "max_size": self.max_size}
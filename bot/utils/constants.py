@@ -56,6 +56,13 @@ CHATTY_ROLE_ID = 1127402424022351903
 BOOSTER_ROLE_ID = 585605309997907981
 
 
+##############
+#  Rankings  #
+##############
+
+LEADERBOARD_PAGE_SIZE = 10
+
+
 ############
 #  Emotes  #
 ############
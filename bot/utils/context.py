@@ -34,6 +34,10 @@ class IContext(Context[IBot]):
     context for all commands in the bot.
     """
 
+    # When the command started running. This is set by the bot to
+    # measure how long commands take.
+    started_at: Optional[float] = None
+
     def is_booster(self) -> bool:
         """Returns whether the author of the command is a booster.
 
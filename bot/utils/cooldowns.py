@@ -0,0 +1,224 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from datetime import timedelta
+from time import monotonic
+from typing import Any, Dict, Optional
+
+from discord.ext.commands import (  # type: ignore
+    BucketType,
+    CommandOnCooldown,
+    Cooldown,
+)
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert  # type: ignore
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.utils.database import UserCooldown
+
+
+class CooldownStore(ABC):
+    """Base class for the cooldown stores. A cooldown allows each user
+    to do something once every ``per`` seconds.
+
+    Parameters
+    ----------
+    per: :class:`float`
+        The length of the cooldown, in seconds.
+    """
+
+    def __init__(self, per: float) -> None:
+        self.per = per
+
+    def start(self) -> None:
+        """Starts the background work of the store, if any. This must
+        be called from a running event loop.
+        """
+
+    async def close(self) -> None:
+        """Stops the background work of the store, if any."""
+
+    @abstractmethod
+    async def acquire(self, user_id: int) -> Optional[float]:
+        """Starts the cooldown of a user, unless it's still running.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user.
+
+        Returns
+        -------
+        Optional[:class:`float`]
+            ``None`` if the cooldown was started, otherwise the seconds
+            left until it ends.
+        """
+
+    async def check(self, user_id: int) -> None:
+        """Starts the cooldown of a user, like :meth:`acquire`, for a
+        command.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user.
+
+        Raises
+        ------
+        CommandOnCooldown
+            The cooldown of the user is still running.
+        """
+        retry_after = await self.acquire(user_id)
+
+        if retry_after is not None:
+            cooldown = Cooldown(1, self.per)
+            raise CommandOnCooldown(cooldown, retry_after, BucketType.user)
+
+
+class MemoryCooldownStore(CooldownStore):
+    """A cooldown store that lives in memory, for short cooldowns that
+    don't need to survive a restart. Expired cooldowns are evicted
+    periodically, so the memory used is bounded by the users that are
+    on cooldown.
+
+    Parameters
+    ----------
+    per: :class:`float`
+        The length of the cooldown, in seconds.
+    sweep_interval: :class:`float`
+        The seconds between each eviction of the expired cooldowns.
+    """
+
+    def __init__(self, per: float, *, sweep_interval: float) -> None:
+        super().__init__(per)
+
+        self.sweep_interval = sweep_interval
+        # A mapping of user IDs to the monotonic time their cooldown
+        # ends.
+        self.expires: Dict[int, float] = {}
+        self.task: Optional[asyncio.Task[None]] = None
+
+    def __len__(self) -> int:
+        return len(self.expires)
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+
+            with suppress(asyncio.CancelledError):
+                await self.task
+
+            self.task = None
+
+    async def acquire(self, user_id: int) -> Optional[float]:
+        now = monotonic()
+        expires = self.expires.get(user_id, 0)
+
+        if expires > now:
+            return expires - now
+
+        self.expires[user_id] = now + self.per
+        return None
+
+    def sweep(self) -> None:
+        """Evicts the cooldowns that have ended."""
+        now = monotonic()
+        self.expires = {k: v for k, v in self.expires.items() if v > now}
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            self.sweep()
+
+
+def claim_cooldown(name: str, user_id: int, per: float) -> Any:
+    """Builds the statement that claims a cooldown for a user, unless
+    their last claim is more recent than ``per`` seconds ago. This is a
+    single upsert on the primary key of the cooldowns table, so it's
+    atomic even when many processes share the table.
+
+    The statement returns whether the cooldown was claimed and the
+    seconds left until it ends.
+
+    Parameters
+    ----------
+    name: :class:`str`
+        The name of the cooldown.
+    user_id: :class:`int`
+        The ID of the user.
+    per: :class:`float`
+        The length of the cooldown, in seconds.
+    """
+    now = func.timezone("UTC", func.now())
+    stmt = insert(UserCooldown).values(  # type: ignore
+        name=name, user_id=user_id, claimed_at=now
+    )
+
+    expired = UserCooldown.claimed_at <= now - timedelta(seconds=per)
+    claimed_at = case(
+        (expired, stmt.excluded.claimed_at),
+        else_=UserCooldown.claimed_at,
+    )
+    retry_after = func.extract(
+        "epoch", UserCooldown.claimed_at + timedelta(seconds=per) - now
+    )
+
+    return stmt.on_conflict_do_update(
+        index_elements=[UserCooldown.name, UserCooldown.user_id],
+        set_=dict(claimed_at=claimed_at),
+    ).returning(
+        (UserCooldown.claimed_at == now).label("claimed"),
+        retry_after.label("retry_after"),
+    )
+
+
+class DatabaseCooldownStore(CooldownStore):
+    """A cooldown store that keeps the last claim of each user in the
+    database, for long cooldowns that must survive restarts and be
+    shared by every process.
+
+    Parameters
+    ----------
+    engine: :class:`sqlalchemy.ext.asyncio.AsyncEngine`
+        The engine used to query the database.
+    name: :class:`str`
+        The name of the cooldown. Cooldowns with different names are
+        independent from each other.
+    per: :class:`float`
+        The length of the cooldown, in seconds.
+    """
+
+    def __init__(self, engine: AsyncEngine, name: str, per: float) -> None:
+        super().__init__(per)
+
+        self.engine = engine
+        self.name = name
+
+    async def acquire(self, user_id: int) -> Optional[float]:
+        stmt = claim_cooldown(self.name, user_id, self.per)
+
+        async with self.engine.begin() as conn:
+            result = (await conn.execute(stmt)).one()
+
+        return None if result.claimed else float(result.retry_after)
@@ -20,10 +20,12 @@ from os import environ
 
 from sqlalchemy import BigInteger
 from sqlalchemy import Column as BaseColumn
-from sqlalchemy import DateTime, String
-from sqlalchemy.ext.asyncio import AsyncAttrs
+from sqlalchemy import Date, DateTime, Identity, Index, String
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
+from bot.utils.pool import InstrumentedPool
+
 DB_USER = environ["POSTGRES_USER"]
 DB_PASS = environ["POSTGRES_PASSWORD"]
 DB_HOST = environ["POSTGRES_HOST"]
@@ -34,6 +36,17 @@ DB_URL = (
     f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
 
+# Connection pool settings. Every listener and command takes its own
+# connection, so bursts of events can exhaust the pool quickly.
+DB_POOL_SIZE = int(environ.get("POSTGRES_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(environ.get("POSTGRES_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(environ.get("POSTGRES_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(environ.get("POSTGRES_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = environ.get("POSTGRES_POOL_PRE_PING", "true") == "true"
+DB_STATEMENT_CACHE_SIZE = int(
+    environ.get("POSTGRES_STATEMENT_CACHE_SIZE", 100)
+)
+
 
 Column = partial(BaseColumn, nullable=False)
 
@@ -50,6 +63,8 @@ class LevelUser(Base):
     user_id = Column(BigInteger, primary_key=True)
     exp = Column(BigInteger, default=0)
 
+    __table_args__ = (Index("ix_levels_exp", exp.desc()),)
+
 
 class DiscordMessage(Base):
     """Represents a Discord message."""
@@ -60,7 +75,23 @@ class DiscordMessage(Base):
     author_id = Column(BigInteger)
     channel_id = Column(BigInteger)
     content = Column(String)
-    created_at = Column(DateTime)
+    created_at = Column(DateTime, primary_key=True)
+
+    # The table is partitioned by month, see ``bot.utils.partitions``.
+    __table_args__ = (
+        Index("ix_messages_created_at_author_id", created_at, author_id),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+
+class MessageCount(Base):
+    """Represents how many messages a user sent in a day."""
+
+    __tablename__ = "message_counts"
+
+    day = Column(Date, primary_key=True)
+    author_id = Column(BigInteger, primary_key=True)
+    count = Column(BigInteger, default=0)
 
 
 class EconomyUser(Base):
@@ -70,3 +101,55 @@ class EconomyUser(Base):
 
     user_id = Column(BigInteger, primary_key=True)
     balance = Column(BigInteger, default=0)
+
+    __table_args__ = (Index("ix_economy_balance", balance.desc()),)
+
+
+class EconomyTransaction(Base):
+    """Represents a movement of coins. The table is append-only: the
+    balances are changed in the same transaction that inserts the
+    movement, so they can always be rebuilt from it.
+    """
+
+    __tablename__ = "economy_transactions"
+
+    transaction_id = Column(BigInteger, Identity(), primary_key=True)
+    # The sender is ``NULL`` for coins created by the bot, such as the
+    # daily reward.
+    sender_id = Column(BigInteger, nullable=True)
+    receiver_id = Column(BigInteger)
+    amount = Column(BigInteger)
+    reason = Column(String)
+    created_at = Column(DateTime)
+
+
+class UserCooldown(Base):
+    """Represents the last time a user claimed a cooldown."""
+
+    __tablename__ = "cooldowns"
+
+    name = Column(String, primary_key=True)
+    user_id = Column(BigInteger, primary_key=True)
+    claimed_at = Column(DateTime)
+
+
+def create_engine() -> AsyncEngine:
+    """Creates the engine used by the bot, with the connection pool
+    configured from the environment and instrumented with
+    :class:`bot.utils.pool.InstrumentedPool`.
+
+    Returns
+    -------
+    :class:`sqlalchemy.ext.asyncio.AsyncEngine`
+        The engine.
+    """
+    return create_async_engine(
+        DB_URL,
+        poolclass=InstrumentedPool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=dict(statement_cache_size=DB_STATEMENT_CACHE_SIZE),
+    )
@@ -0,0 +1,90 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from pathlib import Path
+from typing import List, Set
+
+
+def find_extensions(path: str) -> List[str]:
+    """Finds the extensions in a directory, that is, the modules
+    directly inside it. Unlike the helper from jishaku, this doesn't
+    import jishaku, which imports every one of its features.
+
+    Parameters
+    ----------
+    path: :class:`str`
+        The path of the directory, relative to the working directory.
+
+    Returns
+    -------
+    List[:class:`str`]
+        The names of the extensions, sorted.
+    """
+    return sorted(
+        ".".join(module.with_suffix("").parts)
+        for module in Path(path).glob("*.py")
+        if not module.name.startswith("_")
+    )
+
+
+def get_short_name(extension: str) -> str:
+    return extension.rpartition(".")[2]
+
+
+def parse_names(names: str) -> Set[str]:
+    return set(filter(None, map(str.strip, names.split(","))))
+
+
+def filter_extensions(
+    extensions: List[str], *, allow: str, deny: str
+) -> List[str]:
+    """Filters the extensions to load by their short names, such as
+    ``levels`` for ``bot.extensions.levels``.
+
+    Parameters
+    ----------
+    extensions: List[:class:`str`]
+        The names of the extensions found.
+    allow: :class:`str`
+        A comma-separated list of the extensions to load. An empty
+        string allows every extension.
+    deny: :class:`str`
+        A comma-separated list of the extensions not to load. This
+        takes precedence over ``allow``.
+
+    Returns
+    -------
+    List[:class:`str`]
+        The names of the extensions to load.
+
+    Raises
+    ------
+    ValueError
+        An extension in one of the lists doesn't exist.
+    """
+    allowed, denied = parse_names(allow), parse_names(deny)
+    names = {get_short_name(extension): extension for extension in extensions}
+    unknown = (allowed | denied) - names.keys()
+
+    if unknown:
+        raise ValueError(f"Unknown extension: {min(unknown)!r}.")
+
+    return [
+        extension
+        for name, extension in names.items()
+        if name not in denied and (not allowed or name in allowed)
+    ]
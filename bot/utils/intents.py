@@ -0,0 +1,101 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from importlib import import_module
+from typing import Iterable
+
+from discord import Intents, MemberCacheFlags
+
+# The intents needed by the bot itself: the guild and its roles and
+# channels, and the messages to run prefix commands.
+BASE_INTENTS = Intents(
+    guilds=True,
+    guild_messages=True,
+    dm_messages=True,
+    message_content=True,
+)
+
+
+def get_intents(extensions: Iterable[str], *, profile: str) -> Intents:
+    """Gets the gateway intents for the given extensions. Extensions
+    declare the intents they use in a module-level ``INTENTS``
+    attribute.
+
+    Parameters
+    ----------
+    extensions: Iterable[:class:`str`]
+        The names of the extensions that will be loaded.
+    profile: :class:`str`
+        Either ``declared``, which requests only the intents declared
+        by the extensions, or ``all``, which requests every intent.
+
+    Returns
+    -------
+    :class:`discord.Intents`
+        The intents to request.
+
+    Raises
+    ------
+    ValueError
+        The profile is not valid.
+    """
+    if profile == "all":
+        return Intents.all()
+
+    if profile != "declared":
+        raise ValueError(f"Invalid intents profile: {profile!r}.")
+
+    intents = BASE_INTENTS
+
+    for extension in extensions:
+        declared = getattr(import_module(extension), "INTENTS", None)
+
+        if declared is not None:
+            intents = intents | declared
+
+    return intents
+
+
+def get_member_cache_flags(flags: str) -> MemberCacheFlags:
+    """Gets the member cache flags from a comma-separated list of flag
+    names, such as ``joined`` or ``voice,joined``.
+
+    Parameters
+    ----------
+    flags: :class:`str`
+        The names of the flags to enable. An empty string disables the
+        member cache.
+
+    Returns
+    -------
+    :class:`discord.MemberCacheFlags`
+        The member cache flags.
+
+    Raises
+    ------
+    ValueError
+        A flag name is not valid.
+    """
+    cache_flags = MemberCacheFlags.none()
+
+    for name in filter(None, map(str.strip, flags.split(","))):
+        if name not in MemberCacheFlags.VALID_FLAGS:
+            raise ValueError(f"Invalid member cache flag: {name!r}.")
+
+        setattr(cache_flags, name, True)
+
+    return cache_flags
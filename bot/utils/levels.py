@@ -0,0 +1,255 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.utils.database import LevelUser
+from bot.utils.ranking import Ranking
+from bot.utils.statements import UPSERT_EXPERIENCE
+
+log = logging.getLogger(__name__)
+
+
+class LevelCurve:
+    """The experience curve used by the ranking system. The experience
+    required to go from a level to the next one is given by:
+
+    .. code-block:: python
+
+        5 * (level**2) + (50 * level) + 100
+
+    To avoid walking the whole curve level by level, the total
+    experience required to reach a level is given by the sum of the
+    curve, and levels are found with its inverse.
+    """
+
+    def get_level_exp(self, level: int) -> int:
+        """Get the experience required to go from the given level to
+        the next one.
+
+        Parameters
+        ----------
+        level: :class:`int`
+            The level to get the experience required to pass it.
+
+        Returns
+        -------
+        :class:`int`
+            The experience required to pass the given level.
+        """
+        return 5 * (level**2) + (50 * level) + 100
+
+    def get_total_exp(self, level: int) -> int:
+        """Get the total experience required to reach the given level
+        from zero experience.
+
+        Parameters
+        ----------
+        level: :class:`int`
+            The level to get the total experience required to reach it.
+
+        Returns
+        -------
+        :class:`int`
+            The total experience required to reach the given level.
+        """
+        # The sum of the curve over the levels below the given one. The
+        # product of the first term is always a multiple of six.
+        squares = (level - 1) * level * (2 * level - 1) // 6
+        return 5 * squares + 25 * level * (level - 1) + 100 * level
+
+    def get_level(self, exp: int) -> int:
+        """Get the level from the given experience.
+
+        Parameters
+        ----------
+        exp: :class:`int`
+            The experience to get the level from.
+
+        Returns
+        -------
+        :class:`int`
+            The level from the given experience.
+        """
+        if exp < self.get_level_exp(0):
+            return 0
+
+        # The total experience is a little under ``5 / 3 * (level +
+        # 4.5) ** 3``, so its cube root is at most a couple of levels
+        # away from the actual one, which the checks below correct.
+        level = max(int((0.6 * exp) ** (1 / 3) - 4.5), 0)
+
+        while self.get_total_exp(level + 1) <= exp:
+            level += 1
+
+        while self.get_total_exp(level) > exp:
+            level -= 1
+
+        return level
+
+
+class ExperienceStore:
+    """An in-memory store of the experience of every user. This is the
+    authoritative copy of the ``levels`` table while the bot is running:
+    reads are served from memory and writes only mark the user as dirty.
+    Dirty users are written back to the database in one statement every
+    ``flush_interval`` seconds, or earlier when ``flush_threshold``
+    users are dirty.
+
+    The store is flushed when it is closed, so a clean shutdown loses
+    nothing. If the process crashes, at most the experience awarded in
+    the last ``flush_interval`` seconds is lost.
+
+    Parameters
+    ----------
+    engine: :class:`sqlalchemy.ext.asyncio.AsyncEngine`
+        The engine used to load and flush the experience.
+    flush_interval: :class:`float`
+        The maximum amount of seconds between two flushes.
+    flush_threshold: :class:`int`
+        The amount of dirty users that triggers an early flush.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        *,
+        flush_interval: float,
+        flush_threshold: int,
+    ) -> None:
+        self.engine = engine
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        self.exp: Dict[int, int] = {}
+        self.dirty: Set[int] = set()
+        # Users sorted by their experience, used by the leaderboard.
+        self.ranking = Ranking()
+
+        self.lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task[None]] = None
+
+    async def load(self) -> None:
+        """Loads the experience of every user from the database."""
+        async with self.engine.begin() as conn:
+            stmt = select(LevelUser.user_id, LevelUser.exp).order_by(
+                LevelUser.exp.desc()
+            )
+            result = await conn.execute(stmt)
+
+            self.exp = {row.user_id: row.exp for row in result}
+
+        self.ranking.load(self.exp)
+
+    def start(self) -> None:
+        """Starts the background task that flushes the store. This must
+        be called from a running event loop.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        """Stops the background task and flushes every dirty user."""
+        if self.task is not None:
+            self.task.cancel()
+
+            with suppress(asyncio.CancelledError):
+                await self.task
+
+            self.task = None
+
+        await self.flush()
+
+    def get(self, user_id: int) -> int:
+        """Gets the experience of a user, or zero if they don't have
+        any experience yet.
+        """
+        return self.exp.get(user_id, 0)
+
+    def set(self, user_id: int, exp: int) -> int:
+        """Sets the experience of a user and returns it."""
+        self.exp[user_id] = exp
+        self.dirty.add(user_id)
+        self.ranking.update(user_id, exp)
+
+        if len(self.dirty) >= self.flush_threshold:
+            self.wakeup.set()
+
+        return exp
+
+    def add(self, user_id: int, to_add: int) -> int:
+        """Adds experience to a user and returns their new total."""
+        return self.set(user_id, self.get(user_id) + to_add)
+
+    async def delete(self, user_id: int) -> None:
+        """Deletes a user from the store and from the database."""
+        self.exp.pop(user_id, None)
+        self.dirty.discard(user_id)
+        self.ranking.remove(user_id)
+
+        # Waiting for the lock makes sure that a flush which started
+        # before the user was deleted can't insert them back.
+        async with self.lock, self.engine.begin() as conn:
+            stmt = delete(LevelUser).where(LevelUser.user_id == user_id)
+            await conn.execute(stmt)
+
+    async def flush(self) -> None:
+        """Writes every dirty user to the database."""
+        async with self.lock:
+            rows = [dict(user_id=i, exp=self.exp[i]) for i in self.dirty]
+            self.dirty.clear()
+
+            try:
+                await self.write(rows)
+            except BaseException:
+                # Users that are still in the store are marked as dirty
+                # again, so the next flush retries them.
+                self.dirty.update(r["user_id"] for r in rows)
+                self.dirty.intersection_update(self.exp)
+                raise
+
+    async def write(self, rows: List[Dict[str, int]]) -> None:
+        if not rows:
+            return
+
+        params = dict(
+            user_ids=[row["user_id"] for row in rows],
+            exps=[row["exp"] for row in rows],
+        )
+
+        async with self.engine.begin() as conn:
+            await conn.execute(UPSERT_EXPERIENCE, params)
+
+    async def run(self) -> None:
+        while True:
+            with suppress(TimeoutError):
+                async with asyncio.timeout(self.flush_interval):
+                    await self.wakeup.wait()
+
+            self.wakeup.clear()
+
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Failed to flush the experience store")
@@ -0,0 +1,276 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from bisect import bisect_left
+from contextlib import contextmanager, suppress
+from functools import wraps
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
+
+T = TypeVar("T")
+Coro = Callable[..., Coroutine[Any, Any, T]]
+
+# The upper bounds of the histogram buckets, in seconds. They grow by
+# about 19% from 10 microseconds to 10 minutes, so the percentiles are
+# within 19% of the real values.
+BUCKETS: List[float] = [1e-5 * 2 ** (i / 4) for i in range(104)]
+
+
+class Histogram:
+    """A histogram of durations. The durations are counted in fixed
+    buckets instead of being stored, so recording one is a binary
+    search and the memory used is constant.
+    """
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """Records a duration.
+
+        Parameters
+        ----------
+        value: :class:`float`
+            The duration, in seconds.
+        """
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+
+        if value > self.max:
+            self.max = value
+
+    def get_percentile(self, percentile: float) -> float:
+        """Gets an estimate of a percentile of the durations.
+
+        Parameters
+        ----------
+        percentile: :class:`float`
+            The percentile, from 0 to 100.
+
+        Returns
+        -------
+        :class:`float`
+            The upper bound of the bucket that holds the percentile, in
+            seconds, or zero if nothing was recorded.
+        """
+        rank = percentile / 100 * self.count
+        seen = 0
+
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+
+            if seen and seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def get_stats(self) -> Dict[str, float]:
+        """Gets the statistics of the histogram.
+
+        Returns
+        -------
+        Dict[:class:`str`, :class:`float`]
+            A mapping of each statistic name to its value. Durations
+            are in milliseconds.
+        """
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "p50_ms": round(self.get_percentile(50) * 1000, 2),
+            "p95_ms": round(self.get_percentile(95) * 1000, 2),
+            "p99_ms": round(self.get_percentile(99) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class Metrics:
+    """The histograms and counters of the bot, by name."""
+
+    def __init__(self) -> None:
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+
+    def increment(self, name: str, value: int = 1) -> None:
+        """Increments a counter, creating it if it doesn't exist yet.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the counter.
+        value: :class:`int`
+            The amount to add to the counter. Defaults to ``1``.
+        """
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def get(self, name: str) -> Histogram:
+        """Gets a histogram, creating it if it doesn't exist yet.
+
+        Parameters
+        ----------
+        name: :class:`str`
+            The name of the histogram.
+
+        Returns
+        -------
+        :class:`Histogram`
+            The histogram.
+        """
+        histogram = self.histograms.get(name)
+
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+
+        return histogram
+
+    def instrument(self, func: Coro[T], name: str) -> Coro[T]:
+        """Wraps a coroutine function so its durations and errors are
+        recorded in a histogram.
+
+        Parameters
+        ----------
+        func: Callable[..., Coroutine[Any, Any, T]]
+            The coroutine function to wrap.
+        name: :class:`str`
+            The name of the histogram.
+
+        Returns
+        -------
+        Callable[..., Coroutine[Any, Any, T]]
+            The wrapped coroutine function.
+        """
+        histogram = self.get(name)
+
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            start = perf_counter()
+
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                histogram.errors += 1
+                raise
+            finally:
+                histogram.observe(perf_counter() - start)
+
+        return wrapper
+
+
+class LagMonitor:
+    """Measures the lag of the event loop, that is, how late a callback
+    runs after it was due. A high lag means something is blocking the
+    loop, and every event waits for it.
+
+    Parameters
+    ----------
+    histogram: :class:`Histogram`
+        The histogram to record the lag in.
+    interval: :class:`float`
+        The seconds between each sample.
+    """
+
+    def __init__(self, histogram: Histogram, *, interval: float) -> None:
+        self.histogram = histogram
+        self.interval = interval
+        self.task: Optional[asyncio.Task[None]] = None
+
+    def start(self) -> None:
+        """Starts sampling the lag. This must be called from a running
+        event loop.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        """Stops sampling the lag."""
+        if self.task is not None:
+            self.task.cancel()
+
+            with suppress(asyncio.CancelledError):
+                await self.task
+
+            self.task = None
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.histogram.observe(max(loop.time() - expected, 0))
+
+
+class StartupProfiler:
+    """Measures how long each step of the startup of the bot takes, such
+    as importing and loading each extension.
+    """
+
+    def __init__(self) -> None:
+        self.steps: Dict[str, float] = {}
+
+    @contextmanager
+    def measure(self, step: str) -> Iterator[None]:
+        """Measures the duration of the code inside the context.
+
+        Parameters
+        ----------
+        step: :class:`str`
+            The name of the step.
+        """
+        start = perf_counter()
+
+        try:
+            yield
+        finally:
+            self.steps[step] = perf_counter() - start
+
+    def record(self, step: str, duration: float) -> None:
+        """Records the duration of a step measured elsewhere.
+
+        Parameters
+        ----------
+        step: :class:`str`
+            The name of the step.
+        duration: :class:`float`
+            The duration, in seconds.
+        """
+        self.steps[step] = duration
+
+    def get_stats(self) -> Dict[str, float]:
+        """Gets the duration of each step, slowest first.
+
+        Returns
+        -------
+        Dict[:class:`str`, :class:`float`]
+            A mapping of each step to its duration, in milliseconds.
+        """
+        steps = sorted(self.steps.items(), key=lambda item: -item[1])
+        return {step: round(duration * 1000, 1) for step, duration in steps}
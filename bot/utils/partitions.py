@@ -0,0 +1,146 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+from datetime import date
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+
+def add_months(month: date, months: int) -> date:
+    """Gets the first day of the month that is ``months`` months after
+    the month of the given date. Negative values go back in time.
+
+    Parameters
+    ----------
+    month: :class:`datetime.date`
+        The date to start from.
+    months: :class:`int`
+        The amount of months to move.
+
+    Returns
+    -------
+    :class:`datetime.date`
+        The first day of the resulting month.
+    """
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_partition_name(table: str, month: date) -> str:
+    """Gets the name of the partition of a table that holds the rows of
+    the given month, e.g. ``messages_y2023m07``.
+    """
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+async def create_monthly_partitions(
+    conn: AsyncConnection,
+    table: str,
+    *,
+    start: date,
+    months: int,
+) -> None:
+    """Creates the monthly partitions of a table, starting at the month
+    of ``start``. Partitions that already exist are left untouched.
+
+    Parameters
+    ----------
+    conn: :class:`sqlalchemy.ext.asyncio.AsyncConnection`
+        The connection to use.
+    table: :class:`str`
+        The name of the partitioned table.
+    start: :class:`datetime.date`
+        A date in the first month to create.
+    months: :class:`int`
+        The amount of months to create.
+    """
+    for offset in range(months):
+        month = add_months(start, offset)
+        end = add_months(month, 1)
+
+        await conn.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS "
+                f"{get_partition_name(table, month)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month}') TO ('{end}')"
+            )
+        )
+
+
+async def get_expired_partitions(
+    conn: AsyncConnection,
+    table: str,
+    *,
+    before: date,
+) -> List[str]:
+    """Gets the monthly partitions of a table that only hold rows older
+    than the month of ``before``.
+
+    Parameters
+    ----------
+    conn: :class:`sqlalchemy.ext.asyncio.AsyncConnection`
+        The connection to use.
+    table: :class:`str`
+        The name of the partitioned table.
+    before: :class:`datetime.date`
+        A date in the oldest month to keep.
+
+    Returns
+    -------
+    List[:class:`str`]
+        The names of the expired partitions, oldest first.
+    """
+    stmt = text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = CAST(:table AS regclass)"
+    )
+    result = await conn.execute(stmt, dict(table=table))
+
+    pattern = re.compile(rf"{table}_y\d{{4}}m\d{{2}}")
+    cutoff = get_partition_name(table, before)
+
+    # Partition names sort in the same order as their months.
+    return sorted(
+        name
+        for (name,) in result.all()
+        if pattern.fullmatch(name) is not None and name < cutoff
+    )
+
+
+async def drop_partitions(
+    conn: AsyncConnection, table: str, names: List[str]
+) -> None:
+    """Detaches and drops partitions of a table.
+
+    Parameters
+    ----------
+    conn: :class:`sqlalchemy.ext.asyncio.AsyncConnection`
+        The connection to use.
+    table: :class:`str`
+        The name of the partitioned table.
+    names: List[:class:`str`]
+        The names of the partitions to drop.
+    """
+    for name in names:
+        await conn.execute(
+            text(f"ALTER TABLE {table} DETACH PARTITION {name}")
+        )
+        await conn.execute(text(f"DROP TABLE {name}"))
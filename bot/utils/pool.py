@@ -0,0 +1,130 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from time import perf_counter
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, PoolProxiedConnection
+
+
+class PoolMetrics:
+    """Counters about the connections taken from a pool."""
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.connects = 0
+        self.waits = 0
+        self.max_in_use = 0
+        self.total_checkout_time = 0.0
+        self.max_checkout_time = 0.0
+
+    def record(self, elapsed: float, *, waited: bool) -> None:
+        """Records the time taken by a checkout.
+
+        Parameters
+        ----------
+        elapsed: :class:`float`
+            The amount of seconds it took to get the connection.
+        waited: :class:`bool`
+            Whether the pool was exhausted, so the checkout had to wait
+            for a connection to be returned.
+        """
+        self.waits += waited
+        self.total_checkout_time += elapsed
+        self.max_checkout_time = max(self.max_checkout_time, elapsed)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """A connection pool that measures how long it takes to check out a
+    connection and how often the pool is exhausted.
+
+    The checkouts and the new connections are counted by the events of
+    the pool. The pool has no event before a checkout, so the time it
+    takes is measured around :meth:`connect` instead.
+    """
+
+    def __init__(
+        self,
+        creator: Any,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(
+            creator, pool_size=pool_size, max_overflow=max_overflow, **kwargs
+        )
+        self.max_overflow = max_overflow
+        self.metrics = PoolMetrics()
+
+        event.listen(self, "checkout", self.on_checkout)
+        event.listen(self, "connect", self.on_connect)
+
+    def connect(self) -> PoolProxiedConnection:
+        exhausted = self.checkedin() == 0 and (
+            -1 < self.max_overflow <= self.overflow()
+        )
+        start = perf_counter()
+
+        try:
+            return super().connect()
+        finally:
+            self.metrics.record(perf_counter() - start, waited=exhausted)
+
+    def recreate(self) -> AsyncAdaptedQueuePool:
+        # The new pool copies the listeners of this one, and adds its
+        # own, so these are removed to not keep this pool alive.
+        event.remove(self, "checkout", self.on_checkout)
+        event.remove(self, "connect", self.on_connect)
+
+        return super().recreate()
+
+    def on_checkout(
+        self, dbapi_connection: Any, record: Any, proxy: Any
+    ) -> None:
+        self.metrics.checkouts += 1
+        self.metrics.max_in_use = max(
+            self.metrics.max_in_use, self.checkedout()
+        )
+
+    def on_connect(self, dbapi_connection: Any, record: Any) -> None:
+        self.metrics.connects += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Gets the current state of the pool along with its metrics.
+
+        Returns
+        -------
+        Dict[:class:`str`, :class:`float`]
+            A mapping of each statistic name to its value. Times are in
+            milliseconds.
+        """
+        metrics = self.metrics
+        average = metrics.total_checkout_time / max(metrics.checkouts, 1)
+
+        return {
+            "size": self.size(),
+            "in_use": self.checkedout(),
+            "max_in_use": metrics.max_in_use,
+            "idle": self.checkedin(),
+            "overflow": max(self.overflow(), 0),
+            "checkouts": metrics.checkouts,
+            "connects": metrics.connects,
+            "waits": metrics.waits,
+            "avg_checkout_ms": round(average * 1000, 3),
+            "max_checkout_ms": round(metrics.max_checkout_time * 1000, 3),
+        }
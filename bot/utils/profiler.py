@@ -0,0 +1,325 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import logging
+import re
+from functools import lru_cache
+from hashlib import sha1
+from time import perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from bot.utils.metrics import Histogram
+
+log = logging.getLogger(__name__)
+
+# The patterns replaced to turn a statement into its fingerprint, in
+# order. Literals and placeholders become ``?``, lists of them, such as
+# expanded ``IN`` clauses, become ``(...)``, and so do the rows of
+# multi-row ``VALUES``, so statements that only differ in their values
+# or in the size of their batches share a fingerprint.
+FINGERPRINT_PATTERNS: List[Tuple["re.Pattern[str]", str]] = [
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\$\d+|%\(\w+\)s|\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"\(\?(?:::\w+)?(?:, \?(?:::\w+)?)+\)"), "(...)"),
+    (re.compile(r"\((?:\?|\.\.\.)\)(?:, \((?:\?|\.\.\.)\))+"), "(...)"),
+]
+
+# The maximum amount of fingerprints kept. Statements built on the fly
+# could still produce new fingerprints forever, so once there are this
+# many, the statements of new fingerprints are recorded together.
+MAX_FINGERPRINTS = 500
+
+# The fingerprint that collects the statements past the limit.
+OVERFLOW_KEY = "overflow"
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(statement: str) -> Tuple[str, str]:
+    """Gets the fingerprint of a statement. The statements run by the
+    bot are few and repeat a lot, so the fingerprints are cached.
+
+    Parameters
+    ----------
+    statement: :class:`str`
+        The statement, as sent to the database.
+
+    Returns
+    -------
+    Tuple[:class:`str`, :class:`str`]
+        A short key that identifies the fingerprint, and the
+        fingerprint itself.
+    """
+    text = statement.strip()
+
+    for pattern, replacement in FINGERPRINT_PATTERNS:
+        text = pattern.sub(replacement, text)
+
+    return sha1(text.encode()).hexdigest()[:8], text
+
+
+class QueryStats:
+    """Statistics of the statements that share a fingerprint.
+
+    Parameters
+    ----------
+    key: :class:`str`
+        The key of the fingerprint.
+    statement: :class:`str`
+        The fingerprint.
+    """
+
+    def __init__(self, key: str, statement: str) -> None:
+        self.key = key
+        self.statement = statement
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        # The statement and parameters of the slowest run, so it can be
+        # explained later.
+        self.sample: Optional[Tuple[str, Any]] = None
+
+    def record(
+        self, elapsed: float, sample: Optional[Tuple[str, Any]]
+    ) -> None:
+        """Records a run of a statement.
+
+        Parameters
+        ----------
+        elapsed: :class:`float`
+            The duration of the run, in seconds.
+        sample: Optional[Tuple[:class:`str`, Any]]
+            The statement and parameters of the run, or ``None`` if it
+            can't be explained.
+        """
+        self.count += 1
+        self.total += elapsed
+
+        if elapsed >= self.max:
+            self.max = elapsed
+            self.sample = sample or self.sample
+
+    def get_stats(self) -> Dict[str, float]:
+        """Gets the statistics of the fingerprint.
+
+        Returns
+        -------
+        Dict[:class:`str`, :class:`float`]
+            A mapping of each statistic name to its value. Durations
+            are in milliseconds.
+        """
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "total_ms": round(self.total * 1000, 2),
+            "avg_ms": round(self.total / max(self.count, 1) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+
+class QueryProfiler:
+    """Profiles every statement run by an engine. The durations are
+    aggregated by fingerprint, so the statements that take most of the
+    time of the database can be found, and the statements slower than
+    a threshold are logged as they happen.
+
+    Parameters
+    ----------
+    histogram: :class:`bot.utils.metrics.Histogram`
+        The histogram to record the duration of every statement in.
+    slow_threshold: :class:`float`
+        The seconds after which a statement is logged as slow. Zero
+        disables the log.
+    """
+
+    def __init__(self, histogram: Histogram, *, slow_threshold: float) -> None:
+        self.histogram = histogram
+        self.slow_threshold = slow_threshold
+        self.queries: Dict[str, QueryStats] = {}
+
+    def attach(self, engine: AsyncEngine) -> None:
+        """Starts profiling the statements run by an engine.
+
+        Parameters
+        ----------
+        engine: :class:`sqlalchemy.ext.asyncio.AsyncEngine`
+            The engine to profile.
+        """
+        sync_engine = engine.sync_engine
+
+        event.listen(
+            sync_engine, "before_cursor_execute", self.before_cursor_execute
+        )
+        event.listen(
+            sync_engine, "after_cursor_execute", self.after_cursor_execute
+        )
+        event.listen(sync_engine, "handle_error", self.handle_error)
+
+    def before_cursor_execute(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        # The start is kept in the execution context, so nothing is left
+        # behind when the statement fails.
+        context.query_started_at = perf_counter()
+
+    def after_cursor_execute(
+        self,
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        elapsed = perf_counter() - context.query_started_at
+        # Batches can't be explained, and their parameters can be huge.
+        sample = None if executemany else (statement, parameters)
+
+        # The run is recorded now, so an error raised later, while
+        # fetching the rows, is only counted as an error of the run.
+        context.query_started_at = None
+        context.query_stats = self.record(statement, elapsed, sample)
+
+    def handle_error(self, exception_context: Any) -> None:
+        context = exception_context.execution_context
+        started_at = getattr(context, "query_started_at", None)
+        stats = getattr(context, "query_stats", None)
+
+        if started_at is not None:
+            stats = self.record(
+                exception_context.statement, perf_counter() - started_at, None
+            )
+
+        # Errors raised before the statement was sent, such as failing
+        # to connect, don't belong to any statement.
+        if stats is not None:
+            stats.errors += 1
+            self.histogram.errors += 1
+
+    def record(
+        self,
+        statement: str,
+        elapsed: float,
+        sample: Optional[Tuple[str, Any]],
+    ) -> QueryStats:
+        """Records a run of a statement.
+
+        Parameters
+        ----------
+        statement: :class:`str`
+            The statement, as sent to the database.
+        elapsed: :class:`float`
+            The duration of the run, in seconds.
+        sample: Optional[Tuple[:class:`str`, Any]]
+            The statement and parameters of the run, or ``None`` if it
+            can't be explained.
+
+        Returns
+        -------
+        :class:`QueryStats`
+            The statistics of the fingerprint of the statement.
+        """
+        key, text = fingerprint(statement)
+        stats = self.queries.get(key)
+
+        if stats is None:
+            stats = self.get_new_stats(key, text)
+
+        stats.record(elapsed, sample)
+        self.histogram.observe(elapsed)
+
+        if self.slow_threshold and elapsed >= self.slow_threshold:
+            log.warning(
+                "Slow query %s took %.1f ms: %s", key, elapsed * 1000, text
+            )
+
+        return stats
+
+    def get_new_stats(self, key: str, statement: str) -> QueryStats:
+        if len(self.queries) >= MAX_FINGERPRINTS:
+            key, statement = OVERFLOW_KEY, "(statements past the limit)"
+
+        stats = self.queries.get(key)
+
+        if stats is None:
+            stats = self.queries[key] = QueryStats(key, statement)
+
+        return stats
+
+    def get_top(self, limit: int) -> List[QueryStats]:
+        """Gets the fingerprints that took the most time in total.
+
+        Parameters
+        ----------
+        limit: :class:`int`
+            The maximum amount of fingerprints to get.
+
+        Returns
+        -------
+        List[:class:`QueryStats`]
+            The fingerprints, slowest first.
+        """
+        queries = sorted(
+            self.queries.values(), key=lambda stats: stats.total, reverse=True
+        )
+        return queries[:limit]
+
+    async def explain(self, engine: AsyncEngine, key: str) -> List[str]:
+        """Gets the plan of the slowest run of a fingerprint. The plan
+        is only estimated, so the statement isn't run again.
+
+        Parameters
+        ----------
+        engine: :class:`sqlalchemy.ext.asyncio.AsyncEngine`
+            The engine used to query the database.
+        key: :class:`str`
+            The key of the fingerprint.
+
+        Returns
+        -------
+        List[:class:`str`]
+            The lines of the plan.
+
+        Raises
+        ------
+        KeyError
+            There is no fingerprint with that key, or none of its runs
+            can be explained.
+        """
+        stats = self.queries.get(key)
+
+        if stats is None or stats.sample is None:
+            raise KeyError(key)
+
+        statement, parameters = stats.sample
+
+        async with engine.connect() as conn:
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN {statement}", parameters
+            )
+
+        return [row[0] for row in result]
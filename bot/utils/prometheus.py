@@ -0,0 +1,217 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from math import isfinite
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional
+
+from aiohttp import web
+
+from bot.utils.metrics import BUCKETS, Histogram
+
+if TYPE_CHECKING:
+    from bot.core import IBot
+else:
+    IBot = Any
+
+# The prefix of every exported metric.
+PREFIX = "incandescent"
+
+# Only every fourth bucket is exported, so each histogram doubles from
+# one bucket to the next. This keeps the amount of series low while
+# still covering the whole range.
+EXPORTED_BUCKETS = list(range(3, len(BUCKETS), 4))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value: str) -> str:
+    """Escapes a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    pairs = ",".join(f'{k}="{escape(v)}"' for k, v in labels.items())
+    return f"{{{pairs}}}"
+
+
+def render_family(
+    name: str, kind: str, description: str, samples: List[str]
+) -> Iterator[str]:
+    yield f"# HELP {PREFIX}_{name} {description}"
+    yield f"# TYPE {PREFIX}_{name} {kind}"
+    yield from samples
+
+
+def render_gauges(
+    name: str, label: str, values: Dict[str, Dict[str, float]]
+) -> List[str]:
+    """Renders a gauge for each statistic of each of the given
+    sources, skipping the values that aren't finite.
+    """
+    return [
+        f"{PREFIX}_{name}"
+        f"{format_labels({label: source, 'stat': stat})} {value}"
+        for source, stats in values.items()
+        for stat, value in stats.items()
+        if isfinite(value)
+    ]
+
+
+def render_histogram(name: str, histogram: Histogram) -> Iterator[str]:
+    family = f"{PREFIX}_duration_seconds"
+    seen = 0
+    start = 0
+
+    for idx in EXPORTED_BUCKETS:
+        seen += sum(histogram.counts[start : idx + 1])  # noqa: E203
+        start = idx + 1
+        labels = format_labels({"name": name, "le": f"{BUCKETS[idx]:.6g}"})
+        yield f"{family}_bucket{labels} {seen}"
+
+    labels = format_labels({"name": name, "le": "+Inf"})
+    yield f"{family}_bucket{labels} {histogram.count}"
+
+    labels = format_labels({"name": name})
+    yield f"{family}_sum{labels} {histogram.total}"
+    yield f"{family}_count{labels} {histogram.count}"
+
+
+def render_metrics(bot: IBot) -> str:
+    """Renders the metrics of the bot in the Prometheus text format.
+
+    Parameters
+    ----------
+    bot: :class:`bot.core.IBot`
+        The bot instance.
+
+    Returns
+    -------
+    :class:`str`
+        The metrics.
+    """
+    histograms = sorted(bot.metrics.histograms.items())
+    counters = sorted(bot.metrics.counters.items())
+    latencies = {str(shard): latency for shard, latency in bot.latencies}
+
+    families = [
+        render_family(
+            "duration_seconds",
+            "histogram",
+            "Duration of the listeners, commands, queries and renders.",
+            [
+                line
+                for name, histogram in histograms
+                for line in render_histogram(name, histogram)
+            ],
+        ),
+        render_family(
+            "errors_total",
+            "counter",
+            "Listeners, commands and queries that failed.",
+            [
+                f"{PREFIX}_errors_total"
+                f"{format_labels({'name': name})} {histogram.errors}"
+                for name, histogram in histograms
+            ],
+        ),
+        render_family(
+            "events_total",
+            "counter",
+            "Things processed by the bot, such as messages.",
+            [
+                f"{PREFIX}_events_total{format_labels({'name': name})} {count}"
+                for name, count in counters
+            ],
+        ),
+        render_family(
+            "gateway_latency_seconds",
+            "gauge",
+            "Latency of the heartbeats of each shard.",
+            [
+                f"{PREFIX}_gateway_latency_seconds"
+                f"{format_labels({'shard': shard})} {latency}"
+                for shard, latency in latencies.items()
+                if isfinite(latency)
+            ],
+        ),
+        render_family(
+            "db_pool",
+            "gauge",
+            "State of the database pool. Times are in milliseconds.",
+            render_gauges(
+                "db_pool", "pool", {"main": bot.db_pool.get_stats()}
+            ),
+        ),
+        render_family(
+            "cache",
+            "gauge",
+            "Statistics of the caches of the bot.",
+            render_gauges(
+                "cache",
+                "cache",
+                {
+                    name: cache.get_stats()
+                    for name, cache in bot.caches.items()
+                },
+            ),
+        ),
+    ]
+
+    return "\n".join(line for family in families for line in family) + "\n"
+
+
+class MetricsServer:
+    """A small HTTP server that exposes the metrics of the bot at
+    ``/metrics``, so they can be scraped by Prometheus.
+
+    Parameters
+    ----------
+    bot: :class:`bot.core.IBot`
+        The bot instance.
+    host: :class:`str`
+        The address to listen on.
+    port: :class:`int`
+        The port to listen on.
+    """
+
+    def __init__(self, bot: IBot, *, host: str, port: int) -> None:
+        self.bot = bot
+        self.host = host
+        self.port = port
+        self.runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        """Starts listening for scrapes."""
+        if self.runner is not None:
+            return
+
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def close(self) -> None:
+        """Stops listening for scrapes."""
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        body = render_metrics(self.bot).encode()
+        return web.Response(body=body, headers={"Content-Type": CONTENT_TYPE})
@@ -0,0 +1,154 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from bisect import bisect_left, insort
+from typing import Dict, List, Mapping, Optional, Tuple
+
+
+class Ranking:
+    """A ranking of users sorted by a score, highest first. Users with
+    the same score are sorted by their ID.
+
+    The ranking is kept as a sorted list and updated incrementally as
+    scores change, so finding the position of a user is a binary search
+    instead of a count over the whole table.
+    """
+
+    def __init__(self) -> None:
+        # Entries are stored as ``(-score, user_id)`` so the natural
+        # ordering of the tuples puts the highest scores first.
+        self.entries: List[Tuple[int, int]] = []
+        self.scores: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def load(self, scores: Mapping[int, int]) -> None:
+        """Replaces the whole ranking with the given scores.
+
+        Parameters
+        ----------
+        scores: Mapping[:class:`int`, :class:`int`]
+            A mapping of user IDs to their scores.
+        """
+        self.scores = dict(scores)
+        self.entries = sorted((-s, i) for i, s in self.scores.items())
+
+    def update(self, user_id: int, score: int) -> None:
+        """Sets the score of a user, adding them to the ranking if they
+        aren't in it yet.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user.
+        score: :class:`int`
+            The new score of the user.
+        """
+        previous = self.scores.get(user_id)
+        self.scores[user_id] = score
+
+        if previous is None:
+            insort(self.entries, (-score, user_id))
+        else:
+            self.move(user_id, previous, score)
+
+    def move(self, user_id: int, previous: int, score: int) -> None:
+        # Scores usually change by a little, so only the entries between
+        # the old and the new position are shifted, instead of removing
+        # and inserting the user, which shifts the whole tail twice.
+        entries = self.entries
+        start = bisect_left(entries, (-previous, user_id))
+        entry = (-score, user_id)
+        end = bisect_left(entries, entry)
+
+        if end < start:
+            entries[end + 1 : start + 1] = entries[end:start]  # noqa: E203
+        elif end > start:
+            # The entry itself is before the new position, so the new
+            # position moves back by one once the entry is taken out.
+            end -= 1
+            entries[start:end] = entries[start + 1 : end + 1]  # noqa: E203
+
+        entries[end] = entry
+
+    def remove(self, user_id: int) -> None:
+        """Removes a user from the ranking, if they are in it.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user to remove.
+        """
+        score = self.scores.pop(user_id, None)
+
+        if score is not None:
+            del self.entries[bisect_left(self.entries, (-score, user_id))]
+
+    def trim(self, size: int) -> None:
+        """Removes the users past the given size, lowest first.
+
+        Parameters
+        ----------
+        size: :class:`int`
+            The maximum amount of users to keep.
+        """
+        for _, user_id in self.entries[size:]:
+            del self.scores[user_id]
+
+        del self.entries[size:]
+
+    def get_position(self, user_id: int) -> Optional[int]:
+        """Gets the position of a user in the ranking, starting at one.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user.
+
+        Returns
+        -------
+        Optional[:class:`int`]
+            The position of the user, or ``None`` if they aren't in the
+            ranking.
+        """
+        score = self.scores.get(user_id)
+
+        if score is None:
+            return None
+
+        return bisect_left(self.entries, (-score, user_id)) + 1
+
+    def get_page(self, page: int, *, per_page: int) -> List[Tuple[int, int]]:
+        """Gets a page of the ranking.
+
+        Parameters
+        ----------
+        page: :class:`int`
+            The page to get, starting at one.
+        per_page: :class:`int`
+            The amount of users in each page.
+
+        Returns
+        -------
+        List[Tuple[:class:`int`, :class:`int`]]
+            The user IDs and scores in the page, highest first.
+        """
+        start, end = (page - 1) * per_page, page * per_page
+        entries = self.entries[start:end]
+
+        return [(user_id, -score) for score, user_id in entries]
@@ -0,0 +1,138 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Union
+
+from discord import Member, NotFound, User
+from discord.utils import MISSING
+
+from bot.utils.cache import TTLCache
+
+if TYPE_CHECKING:
+    from bot.core import IBot
+else:
+    IBot = Any
+
+
+class UserResolver:
+    """Resolves user IDs to members or users. Members of the guild and
+    users in the client cache are returned right away. Everyone else is
+    fetched from the API, and the result is cached for ``ttl`` seconds.
+    Deleted accounts are cached too, so they aren't fetched again and
+    again.
+
+    Parameters
+    ----------
+    bot: :class:`IBot`
+        The bot instance.
+    ttl: :class:`float`
+        The amount of seconds a fetched user is cached.
+    max_size: :class:`int`
+        The maximum amount of fetched users in the cache.
+    concurrency: :class:`int`
+        The maximum amount of users fetched at the same time.
+    """
+
+    def __init__(
+        self,
+        bot: IBot,
+        *,
+        ttl: float,
+        max_size: int,
+        concurrency: int,
+    ) -> None:
+        self.bot = bot
+        self.semaphore = asyncio.Semaphore(concurrency)
+        # The fetched users, or ``None`` for the accounts that don't
+        # exist anymore.
+        self.users: TTLCache[int, Optional[User]] = TTLCache(
+            ttl=ttl, max_size=max_size
+        )
+
+    def get(self, user_id: int) -> Union[Member, User, None]:
+        """Gets a member or user from the caches, without fetching.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user.
+
+        Returns
+        -------
+        Union[:class:`discord.Member`, :class:`discord.User`, None]
+            The member or user, or ``None`` if they aren't cached.
+        """
+        return self.bot.guild.get_member(user_id) or self.bot.get_user(user_id)
+
+    async def resolve(self, user_id: int) -> Union[Member, User, None]:
+        """Gets a member or user, fetching them if necessary.
+
+        Parameters
+        ----------
+        user_id: :class:`int`
+            The ID of the user.
+
+        Returns
+        -------
+        Union[:class:`discord.Member`, :class:`discord.User`, None]
+            The member or user, or ``None`` if the account doesn't exist
+            anymore.
+        """
+        user = self.get(user_id)
+
+        if user is not None:
+            return user
+
+        cached = self.users.get(user_id, MISSING)
+
+        if cached is not MISSING:
+            return cached
+
+        return await self.fetch(user_id)
+
+    async def resolve_many(
+        self, user_ids: Iterable[int]
+    ) -> Dict[int, Union[Member, User, None]]:
+        """Gets many members or users at once, fetching the ones that
+        aren't cached concurrently.
+
+        Parameters
+        ----------
+        user_ids: Iterable[:class:`int`]
+            The IDs of the users.
+
+        Returns
+        -------
+        Dict[:class:`int`, Optional[:class:`discord.abc.User`]]
+            A mapping of each ID to the member or user, or ``None`` if
+            the account doesn't exist anymore.
+        """
+        ids = list(dict.fromkeys(user_ids))
+        users = await asyncio.gather(*(self.resolve(i) for i in ids))
+
+        return dict(zip(ids, users))
+
+    async def fetch(self, user_id: int) -> Optional[User]:
+        async with self.semaphore:
+            try:
+                user = await self.bot.fetch_user(user_id)
+            except NotFound:
+                user = None
+
+        self.users.set(user_id, user)
+        return user
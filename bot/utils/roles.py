@@ -0,0 +1,98 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from typing import Iterable, Optional
+
+from discord import Member, Role
+
+
+async def sync_roles(
+    member: Member,
+    *,
+    add: Iterable[Role] = (),
+    remove: Iterable[Role] = (),
+    reason: Optional[str] = None,
+) -> bool:
+    """Adds and removes roles from a member with a single request. The
+    new roles are computed from the roles the member has in the cache,
+    so nothing is sent if the member already has the wanted roles.
+
+    Parameters
+    ----------
+    member: :class:`discord.Member`
+        The member to update.
+    add: Iterable[:class:`discord.Role`]
+        The roles the member should have.
+    remove: Iterable[:class:`discord.Role`]
+        The roles the member shouldn't have. Roles in both ``add`` and
+        ``remove`` are kept.
+    reason: Optional[:class:`str`]
+        The reason shown in the audit log.
+
+    Returns
+    -------
+    :class:`bool`
+        Whether the roles of the member were changed.
+    """
+    current = [role for role in member.roles if not role.is_default()]
+    add, remove = set(add), set(remove)
+
+    roles = [role for role in current if role not in remove or role in add]
+    roles.extend(role for role in add if role not in current)
+
+    if set(roles) == set(current):
+        return False
+
+    await member.edit(roles=roles, reason=reason)
+    return True
+
+
+async def bulk_sync_roles(
+    members: Iterable[Member],
+    *,
+    add: Iterable[Role] = (),
+    remove: Iterable[Role] = (),
+    concurrency: int,
+    reason: Optional[str] = None,
+) -> None:
+    """Calls :func:`sync_roles` for many members in parallel, with at
+    most ``concurrency`` requests in flight. The rate limits themselves
+    are handled by discord.py, this only keeps a large batch from
+    queueing every request at once.
+
+    Parameters
+    ----------
+    members: Iterable[:class:`discord.Member`]
+        The members to update.
+    add: Iterable[:class:`discord.Role`]
+        The roles the members should have.
+    remove: Iterable[:class:`discord.Role`]
+        The roles the members shouldn't have.
+    concurrency: :class:`int`
+        The maximum amount of requests at the same time.
+    reason: Optional[:class:`str`]
+        The reason shown in the audit log.
+    """
+    add, remove = list(add), list(remove)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def sync(member: Member) -> None:
+        async with semaphore:
+            await sync_roles(member, add=add, remove=remove, reason=reason)
+
+    await asyncio.gather(*(sync(member) for member in members))
@@ -0,0 +1,197 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from os import environ
+
+#############
+#  Discord  #
+#############
+
+# The gateway intents of the bot. ``declared`` requests only the intents
+# declared by the extensions, and ``all`` requests every intent.
+DISCORD_INTENTS = environ.get("DISCORD_INTENTS", "declared")
+
+# The members cached by the bot, as a comma-separated list of
+# ``MemberCacheFlags`` names. The chatty ranking and the member
+# converters need the ``joined`` flag. The ``voice`` flag also keeps
+# the members in voice channels cached, such as for the jishaku voice
+# commands, which only need the voice states requested by jishaku.
+DISCORD_MEMBER_CACHE = environ.get("DISCORD_MEMBER_CACHE", "joined")
+
+# The maximum amount of messages cached by the bot. No extension reads
+# the message cache, so it's disabled by default.
+DISCORD_MAX_MESSAGES = int(environ.get("DISCORD_MAX_MESSAGES", 0))
+
+
+################
+#  Extensions  #
+################
+
+# The extensions loaded by the bot, as comma-separated lists of their
+# module names, such as ``levels``. When ``EXTENSIONS_ALLOW`` is empty,
+# every extension is allowed. ``EXTENSIONS_DENY`` wins over it.
+EXTENSIONS_ALLOW = environ.get("EXTENSIONS_ALLOW", "")
+EXTENSIONS_DENY = environ.get("EXTENSIONS_DENY", "")
+
+
+##############
+#  Messages  #
+##############
+
+# Messages are logged to the database in batches. A batch is written
+# when it reaches ``MESSAGES_BATCH_SIZE`` rows or when
+# ``MESSAGES_FLUSH_INTERVAL`` seconds have passed since its first row,
+# whichever comes first. At most ``MESSAGES_MAX_PENDING`` rows are kept
+# in memory; after that, new messages wait for the database.
+MESSAGES_BATCH_SIZE = int(environ.get("MESSAGES_BATCH_SIZE", 500))
+MESSAGES_FLUSH_INTERVAL = float(environ.get("MESSAGES_FLUSH_INTERVAL", 5))
+MESSAGES_MAX_PENDING = int(environ.get("MESSAGES_MAX_PENDING", 10000))
+
+# The messages table is partitioned by month. Partitions are created
+# ``MESSAGES_PARTITIONS_AHEAD`` months in advance, and partitions older
+# than ``MESSAGES_RETENTION_MONTHS`` months are dropped. Dropping
+# deletes messages for good, so the default retention of zero keeps
+# them forever.
+MESSAGES_PARTITIONS_AHEAD = int(environ.get("MESSAGES_PARTITIONS_AHEAD", 2))
+MESSAGES_RETENTION_MONTHS = int(environ.get("MESSAGES_RETENTION_MONTHS", 0))
+
+
+############
+#  Levels  #
+############
+
+# The experience of every user is kept in memory and written back to the
+# database every ``LEVELS_FLUSH_INTERVAL`` seconds, or earlier when
+# ``LEVELS_FLUSH_THRESHOLD`` users have changed. A crash loses at most
+# the experience awarded since the last flush.
+LEVELS_FLUSH_INTERVAL = float(environ.get("LEVELS_FLUSH_INTERVAL", 30))
+LEVELS_FLUSH_THRESHOLD = int(environ.get("LEVELS_FLUSH_THRESHOLD", 100))
+
+
+###############
+#  Cooldowns  #
+###############
+
+# Short cooldowns, such as the experience one, live in memory. The
+# cooldowns that have ended are evicted every
+# ``COOLDOWNS_SWEEP_INTERVAL`` seconds.
+COOLDOWNS_SWEEP_INTERVAL = float(environ.get("COOLDOWNS_SWEEP_INTERVAL", 300))
+
+
+#############
+#  Economy  #
+#############
+
+# Coins granted by the bot are written to the database in batches, like
+# the messages: a batch is written when it reaches
+# ``ECONOMY_BATCH_SIZE`` grants or ``ECONOMY_FLUSH_INTERVAL`` seconds
+# after its first grant. At most ``ECONOMY_MAX_PENDING`` grants are kept
+# in memory.
+ECONOMY_BATCH_SIZE = int(environ.get("ECONOMY_BATCH_SIZE", 500))
+ECONOMY_FLUSH_INTERVAL = float(environ.get("ECONOMY_FLUSH_INTERVAL", 5))
+ECONOMY_MAX_PENDING = int(environ.get("ECONOMY_MAX_PENDING", 10000))
+# A batch of grants that fails to be written, such as when the database
+# is restarting, is retried ``ECONOMY_WRITE_RETRIES`` times, waiting
+# twice as long before each retry, so the coins aren't lost.
+ECONOMY_WRITE_RETRIES = int(environ.get("ECONOMY_WRITE_RETRIES", 5))
+
+# Balances are cached for ``ECONOMY_CACHE_TTL`` seconds, and at most
+# ``ECONOMY_CACHE_SIZE`` balances are cached. Every write goes through
+# the cache, so the TTL only bounds how long changes made outside the
+# bot take to show up.
+ECONOMY_CACHE_TTL = float(environ.get("ECONOMY_CACHE_TTL", 600))
+ECONOMY_CACHE_SIZE = int(environ.get("ECONOMY_CACHE_SIZE", 10000))
+
+# The richest ``ECONOMY_RANKING_SIZE`` users are loaded into the ranking
+# every ``ECONOMY_RANKING_REFRESH_INTERVAL`` seconds. In between, the
+# ranking is updated as the bot changes balances, so the interval only
+# bounds how long changes made outside the bot take to show up.
+ECONOMY_RANKING_SIZE = int(environ.get("ECONOMY_RANKING_SIZE", 1000))
+ECONOMY_RANKING_REFRESH_INTERVAL = float(
+    environ.get("ECONOMY_RANKING_REFRESH_INTERVAL", 600)
+)
+
+# The coins awarded for chatting, at most once a minute. Zero disables
+# the reward.
+ECONOMY_MESSAGE_REWARD = int(environ.get("ECONOMY_MESSAGE_REWARD", 0))
+
+
+#############
+#  Welcome  #
+#############
+
+# Welcome cards are rendered in ``WELCOME_RENDER_WORKERS`` threads.
+# Members that join within ``WELCOME_BURST_WINDOW`` seconds of each
+# other are welcomed in the same message, and at most
+# ``WELCOME_MAX_PENDING`` members wait to be welcomed.
+WELCOME_RENDER_WORKERS = int(environ.get("WELCOME_RENDER_WORKERS", 2))
+WELCOME_BURST_WINDOW = float(environ.get("WELCOME_BURST_WINDOW", 2))
+WELCOME_MAX_PENDING = int(environ.get("WELCOME_MAX_PENDING", 100))
+
+# Rendered cards are cached by avatar, using at most
+# ``WELCOME_CACHE_BYTES`` bytes of memory.
+WELCOME_CACHE_BYTES = int(environ.get("WELCOME_CACHE_BYTES", 32 * 1024**2))
+
+# The format of the cards: ``png``, ``webp`` or ``jpeg``. The quality is
+# used by WebP and JPEG, and the compression level by PNG. Run
+# ``python manage.py benchwelcome`` to compare the settings.
+WELCOME_FORMAT = environ.get("WELCOME_FORMAT", "webp")
+WELCOME_QUALITY = int(environ.get("WELCOME_QUALITY", 85))
+WELCOME_COMPRESS_LEVEL = int(environ.get("WELCOME_COMPRESS_LEVEL", 6))
+
+
+###########
+#  Users  #
+###########
+
+# Users that aren't members of the guild are fetched from the API at
+# most ``USERS_FETCH_CONCURRENCY`` at a time, and cached for
+# ``USERS_CACHE_TTL`` seconds. At most ``USERS_CACHE_SIZE`` users are
+# cached.
+USERS_CACHE_TTL = float(environ.get("USERS_CACHE_TTL", 3600))
+USERS_CACHE_SIZE = int(environ.get("USERS_CACHE_SIZE", 1000))
+USERS_FETCH_CONCURRENCY = int(environ.get("USERS_FETCH_CONCURRENCY", 5))
+
+
+###########
+#  Roles  #
+###########
+
+# The maximum amount of members whose roles are updated at the same time
+# by bulk operations, such as the weekly chatty ranking.
+ROLES_SYNC_CONCURRENCY = int(environ.get("ROLES_SYNC_CONCURRENCY", 5))
+
+
+#################
+#  Diagnostics  #
+#################
+
+# The event loop lag is sampled every ``DIAGNOSTICS_LAG_INTERVAL``
+# seconds.
+DIAGNOSTICS_LAG_INTERVAL = float(environ.get("DIAGNOSTICS_LAG_INTERVAL", 0.5))
+
+# Queries slower than ``DIAGNOSTICS_SLOW_QUERY_MS`` milliseconds are
+# logged. Zero disables the log.
+DIAGNOSTICS_SLOW_QUERY_MS = float(
+    environ.get("DIAGNOSTICS_SLOW_QUERY_MS", 100)
+)
+
+# When ``METRICS_PORT`` is set, the metrics are served in the Prometheus
+# text format at ``/metrics``. When the bot runs in many processes, each
+# cluster listens on the next port.
+METRICS_HOST = environ.get("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(environ.get("METRICS_PORT", 0))
@@ -0,0 +1,249 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from typing import Any, Callable, Dict
+
+from sqlalchemy import BigInteger, Date, bindparam, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, insert  # type: ignore
+
+from bot.utils.database import (
+    DiscordMessage,
+    EconomyTransaction,
+    EconomyUser,
+    LevelUser,
+    MessageCount,
+)
+
+# Moves coins from one user to another and records the movement, in a
+# single statement. Both balances are locked in the order of their IDs,
+# so concurrent transfers between the same users wait for each other
+# instead of deadlocking. The sender is only debited if they have
+# enough coins, and nothing else happens if they don't, so balances
+# never go negative. The statement returns the new balances of the
+# sender and the receiver, or no rows if the transfer didn't happen.
+TRANSFER_COINS = text("""
+    WITH locked AS (
+        SELECT user_id, balance FROM economy
+        WHERE user_id IN (:sender_id, :receiver_id)
+        ORDER BY user_id
+        FOR UPDATE
+    ), debit AS (
+        UPDATE economy SET balance = economy.balance - :amount
+        FROM locked
+        WHERE economy.user_id = locked.user_id
+            AND locked.user_id = :sender_id
+            AND locked.balance >= :amount
+        RETURNING economy.balance
+    ), credit AS (
+        INSERT INTO economy (user_id, balance)
+        SELECT CAST(:receiver_id AS BIGINT), CAST(:amount AS BIGINT)
+        FROM debit
+        ON CONFLICT (user_id) DO UPDATE
+        SET balance = economy.balance + excluded.balance
+        RETURNING economy.balance
+    ), ledger AS (
+        INSERT INTO economy_transactions
+            (sender_id, receiver_id, amount, reason, created_at)
+        SELECT
+            CAST(:sender_id AS BIGINT),
+            CAST(:receiver_id AS BIGINT),
+            CAST(:amount AS BIGINT),
+            CAST(:reason AS VARCHAR),
+            timezone('UTC', now())
+        FROM debit
+    )
+    SELECT
+        debit.balance AS sender_balance,
+        credit.balance AS receiver_balance
+    FROM debit, credit
+    """)
+
+
+def select_balance() -> Any:
+    """Builds the statement that gets the balance of a user.
+
+    Returns
+    -------
+    :class:`sqlalchemy.sql.Select`
+        The statement, which expects the ``user_id`` parameter.
+    """
+    return select(EconomyUser.balance).where(
+        EconomyUser.user_id == bindparam("user_id")
+    )
+
+
+def upsert_coins() -> Any:
+    """Builds the statement that adds coins to the balance of a user,
+    inserting them if they don't have a balance yet.
+
+    Returns
+    -------
+    :class:`sqlalchemy.dialects.postgresql.Insert`
+        The statement, which expects the ``user_id`` and ``amount``
+        parameters and returns the new balance of the user.
+    """
+    stmt = insert(EconomyUser).values(  # type: ignore
+        user_id=bindparam("user_id"), balance=bindparam("amount")
+    )
+
+    return stmt.on_conflict_do_update(
+        index_elements=[EconomyUser.user_id],
+        set_=dict(balance=EconomyUser.balance + stmt.excluded.balance),
+    ).returning(EconomyUser.balance)
+
+
+def upsert_balances() -> Any:
+    """Builds the statement that adds coins to the balances of many
+    users at once. Like the experience upsert, the rows are passed as
+    two arrays and expanded with ``unnest``.
+
+    Returns
+    -------
+    :class:`sqlalchemy.dialects.postgresql.Insert`
+        The statement, which expects the ``user_ids`` and ``amounts``
+        parameters and returns the new balance of each user.
+    """
+    rows = (
+        func.unnest(
+            bindparam("user_ids", type_=ARRAY(BigInteger)),
+            bindparam("amounts", type_=ARRAY(BigInteger)),
+        )
+        .table_valued("user_id", "amount")
+        .render_derived(name="data")
+    )
+
+    stmt = insert(EconomyUser).from_select(  # type: ignore
+        ["user_id", "balance"], select(rows.c.user_id, rows.c.amount)
+    )
+
+    return stmt.on_conflict_do_update(
+        index_elements=[EconomyUser.user_id],
+        set_=dict(balance=EconomyUser.balance + stmt.excluded.balance),
+    ).returning(EconomyUser.user_id, EconomyUser.balance)
+
+
+def insert_transactions() -> Any:
+    """Builds the statement that inserts economy transactions.
+
+    Returns
+    -------
+    :class:`sqlalchemy.dialects.postgresql.Insert`
+        The statement, which expects the columns of each transaction as
+        parameters.
+    """
+    return insert(EconomyTransaction)
+
+
+def insert_messages() -> Any:
+    """Builds the statement that inserts messages.
+
+    Returns
+    -------
+    :class:`sqlalchemy.dialects.postgresql.Insert`
+        The statement, which expects the columns of each message as
+        parameters.
+    """
+    return insert(DiscordMessage)
+
+
+def upsert_message_counts() -> Any:
+    """Builds the statement that adds to the daily message counts of
+    many users at once. The rows are passed as arrays and expanded with
+    ``unnest``, so the SQL is the same no matter how many rows are
+    written.
+
+    Returns
+    -------
+    :class:`sqlalchemy.dialects.postgresql.Insert`
+        The statement, which expects the ``days``, ``author_ids`` and
+        ``counts`` parameters.
+    """
+    rows = (
+        func.unnest(
+            bindparam("days", type_=ARRAY(Date)),
+            bindparam("author_ids", type_=ARRAY(BigInteger)),
+            bindparam("counts", type_=ARRAY(BigInteger)),
+        )
+        .table_valued("day", "author_id", "count")
+        .render_derived(name="data")
+    )
+
+    stmt = insert(MessageCount).from_select(  # type: ignore
+        ["day", "author_id", "count"],
+        select(rows.c.day, rows.c.author_id, rows.c.count),
+    )
+
+    return stmt.on_conflict_do_update(
+        index_elements=[MessageCount.day, MessageCount.author_id],
+        set_=dict(count=MessageCount.count + stmt.excluded.count),
+    )
+
+
+def upsert_experience() -> Any:
+    """Builds the statement that sets the experience of many users at
+    once. The rows are passed as two arrays and expanded with
+    ``unnest``, so the statement has only two bind parameters and the
+    same SQL no matter how many users are written.
+
+    Returns
+    -------
+    :class:`sqlalchemy.dialects.postgresql.Insert`
+        The statement, which expects the ``user_ids`` and ``exps``
+        parameters.
+    """
+    rows = (
+        func.unnest(
+            bindparam("user_ids", type_=ARRAY(BigInteger)),
+            bindparam("exps", type_=ARRAY(BigInteger)),
+        )
+        .table_valued("user_id", "exp")
+        .render_derived(name="data")
+    )
+
+    stmt = insert(LevelUser).from_select(  # type: ignore
+        ["user_id", "exp"], select(rows.c.user_id, rows.c.exp)
+    )
+
+    return stmt.on_conflict_do_update(
+        index_elements=[LevelUser.user_id],
+        set_=dict(exp=stmt.excluded.exp),
+    )
+
+
+# The builders of the statements run in the hot paths of the bot, by
+# name. Each statement is built once, below, and only the values of its
+# parameters change between executions. Building a statement and
+# generating its cache key costs more than running the compiled form,
+# which SQLAlchemy caches by that key, and its SQL is the same every
+# time, so asyncpg reuses the statement it prepared on the connection.
+BUILDERS: Dict[str, Callable[[], Any]] = {
+    "select balance": select_balance,
+    "upsert coins": upsert_coins,
+    "upsert balances": upsert_balances,
+    "insert transactions": insert_transactions,
+    "insert messages": insert_messages,
+    "upsert message counts": upsert_message_counts,
+    "upsert experience": upsert_experience,
+}
+
+SELECT_BALANCE = select_balance()
+UPSERT_COINS = upsert_coins()
+UPSERT_BALANCES = upsert_balances()
+INSERT_TRANSACTIONS = insert_transactions()
+INSERT_MESSAGES = insert_messages()
+UPSERT_MESSAGE_COUNTS = upsert_message_counts()
+UPSERT_EXPERIENCE = upsert_experience()
@@ -0,0 +1,160 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from threading import Lock
+from typing import Any, Dict
+
+from bot.utils.constants import EMBED_COLOR
+
+
+class WelcomeCard:
+    """Renders the welcome cards sent when a member joins the guild.
+
+    Everything that doesn't depend on the member, that is, the decoded
+    background and the avatar mask, is prepared once. Each card then
+    only pastes the avatar into a copy of the background and encodes it.
+    The rendering runs in a thread pool so it doesn't block the event
+    loop. Pillow releases the GIL while resizing and encoding, so the
+    threads do run in parallel.
+
+    Pillow is only imported, and the background only decoded, by the
+    first render, so the bot doesn't pay for them at startup.
+
+    Parameters
+    ----------
+    path: :class:`str`
+        The path of the background image.
+    workers: :class:`int`
+        The maximum amount of cards rendered at the same time.
+    format: :class:`str`
+        The format of the cards, one of ``png``, ``webp`` or ``jpeg``.
+        Defaults to ``webp``.
+    quality: :class:`int`
+        The quality of ``webp`` and ``jpeg`` cards. Defaults to ``85``.
+    compress_level: :class:`int`
+        The zlib compression level of ``png`` cards. Defaults to ``6``.
+    """
+
+    # The size of the avatar requested from the CDN. This is the
+    # smallest size that is not smaller than the avatar in the card.
+    avatar_size = 512
+
+    size = (500, 500)
+    coords = (208, 257)
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        workers: int,
+        format: str = "webp",
+        quality: int = 85,
+        compress_level: int = 6,
+    ) -> None:
+        self.path = path
+        self.format = format
+
+        self.background: Any = None
+        self.mask: Any = None
+        self.lock = Lock()
+
+        # The fastest WebP method is used, as the slower ones take
+        # several times longer for a slightly smaller file.
+        self.options: Dict[str, Any] = {
+            "png": dict(compress_level=compress_level),
+            "webp": dict(quality=quality, method=0),
+            "jpeg": dict(quality=quality),
+        }[format]
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="welcome"
+        )
+
+    def prepare(self) -> None:
+        """Decodes the background and draws the avatar mask, unless it
+        was done already. This blocks, like :meth:`render`.
+        """
+        if self.background is not None:
+            return
+
+        from PIL import Image, ImageColor, ImageDraw
+
+        with self.lock:
+            if self.background is not None:
+                return
+
+            with Image.open(self.path) as image:
+                background = image.convert("RGBA")
+
+            if self.format == "jpeg":
+                # JPEG has no transparency, so the background is
+                # flattened onto the embed color, which is where the
+                # card is shown.
+                color = ImageColor.getrgb(f"#{EMBED_COLOR:06x}")
+                base = Image.new("RGBA", background.size, color)
+                base.alpha_composite(background)
+                background = base.convert("RGB")
+
+            self.mask = Image.new("L", self.size, 0)
+
+            draw = ImageDraw.Draw(self.mask)
+            draw.ellipse((4, 4, self.size[0] - 4, self.size[1] - 4), fill=255)
+
+            self.background = background
+
+    def render(self, avatar: bytes) -> bytes:
+        """Renders a welcome card. This blocks, so it should only be
+        called from a worker thread.
+
+        Parameters
+        ----------
+        avatar: :class:`bytes`
+            The encoded avatar of the member.
+
+        Returns
+        -------
+        :class:`bytes`
+            The encoded card.
+        """
+        from PIL import Image
+
+        self.prepare()
+
+        with Image.open(BytesIO(avatar)) as image:
+            resized = image.convert("RGBA").resize(self.size)
+
+        welcome = self.background.copy()
+        welcome.paste(resized, box=self.coords, mask=self.mask)
+
+        output = BytesIO()
+        welcome.save(output, format=self.format, **self.options)
+
+        return output.getvalue()
+
+    async def render_async(self, avatar: bytes) -> bytes:
+        """Renders a welcome card in the thread pool. See
+        :meth:`render` for the parameters.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.render, avatar)
+
+    def close(self) -> None:
+        """Shuts the thread pool down."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -16,31 +16,746 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import asyncio
+import gc
+import random
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+from multiprocessing import Process
 from os import environ
+from time import perf_counter
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from warnings import simplefilter
 
 import humanize
-from click import group
+from click import UsageError, echo, group, option
+from discord import Client, Intents, MemberCacheFlags
+from sqlalchemy.dialects.postgresql import insert  # type: ignore
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.ext.asyncio import AsyncConnection
 
 from bot.core import IBot
+from bot.utils.constants import GENERAL_CHANNEL_ID, GUILD_ID
+from bot.utils.database import DiscordMessage, LevelUser, create_engine
+from bot.utils.extensions import filter_extensions, find_extensions
+from bot.utils.intents import get_intents, get_member_cache_flags
+from bot.utils.levels import LevelCurve
+from bot.utils.metrics import Metrics
+from bot.utils.partitions import create_monthly_partitions
+from bot.utils.ranking import Ranking
+from bot.utils.settings import (
+    DISCORD_INTENTS,
+    DISCORD_MAX_MESSAGES,
+    DISCORD_MEMBER_CACHE,
+    EXTENSIONS_ALLOW,
+    EXTENSIONS_DENY,
+    METRICS_PORT,
+    WELCOME_COMPRESS_LEVEL,
+    WELCOME_FORMAT,
+    WELCOME_QUALITY,
+    WELCOME_RENDER_WORKERS,
+)
+from bot.utils.statements import BUILDERS, UPSERT_EXPERIENCE
+from bot.utils.welcome import WelcomeCard
 
+# The welcome card settings compared by the ``benchwelcome`` command.
+WELCOME_SETTINGS: List[Tuple[str, Dict[str, Any]]] = [
+    ("png", dict(compress_level=1)),
+    ("png", dict(compress_level=6)),
+    ("png", dict(compress_level=9)),
+    ("webp", dict(quality=70)),
+    ("webp", dict(quality=85)),
+    ("webp", dict(quality=95)),
+    ("jpeg", dict(quality=70)),
+    ("jpeg", dict(quality=85)),
+    ("jpeg", dict(quality=95)),
+]
 
-async def run_bot() -> None:
+
+# The parameters of each hot path statement measured by
+# ``benchstatements``, given the index of the call. The IDs are negative
+# so they can't collide with any user or message.
+STATEMENT_PARAMS: Dict[str, Callable[[int, datetime], Any]] = {
+    "select balance": lambda idx, now: dict(user_id=-1),
+    "upsert coins": lambda idx, now: dict(user_id=-1, amount=1),
+    "upsert balances": lambda idx, now: dict(
+        user_ids=[-1, -2], amounts=[1, 1]
+    ),
+    "insert transactions": lambda idx, now: dict(
+        sender_id=-1, receiver_id=-2, amount=1, reason="bench", created_at=now
+    ),
+    "insert messages": lambda idx, now: dict(
+        message_id=-idx - 1,
+        author_id=-1,
+        channel_id=-1,
+        content="bench",
+        created_at=now,
+    ),
+    "upsert message counts": lambda idx, now: dict(
+        days=[now.date()], author_ids=[-1], counts=[1]
+    ),
+    "upsert experience": lambda idx, now: dict(user_ids=[-1], exps=[idx]),
+}
+
+# The timestamp used by the synthetic payloads of ``benchmemory``.
+BENCH_TIMESTAMP = "2023-01-01T00:00:00+00:00"
+
+
+def create_user_payload(idx: int) -> Dict[str, Any]:
+    return {
+        "id": str(GUILD_ID + idx + 1),
+        "username": f"user{idx}",
+        "global_name": f"User {idx}",
+        "discriminator": "0",
+        "avatar": None,
+    }
+
+
+def create_guild_payload(members: int, intents: Intents) -> Dict[str, Any]:
+    """Create a synthetic GUILD_CREATE payload, holding what Discord
+    sends for the given intents once the guild is chunked.
+    """
+    users = [create_user_payload(idx) for idx in range(members)]
+    guild_members = [
+        {
+            "user": user,
+            "roles": [],
+            "joined_at": BENCH_TIMESTAMP,
+            "deaf": False,
+            "mute": False,
+            "flags": 0,
+        }
+        for user in users
+    ]
+    presences = [
+        {
+            "user": {"id": user["id"]},
+            "status": "online",
+            "activities": [{"name": "Visual Studio Code", "type": 0}],
+            "client_status": {"desktop": "online"},
+        }
+        for user in users
+    ]
+
+    return {
+        "id": str(GUILD_ID),
+        "name": "Incandescent Society",
+        "member_count": members,
+        "roles": [],
+        "emojis": [],
+        "stickers": [],
+        "threads": [],
+        "voice_states": [],
+        "channels": [
+            {
+                "id": str(GENERAL_CHANNEL_ID),
+                "type": 0,
+                "name": "geral",
+                "position": 0,
+                "permission_overwrites": [],
+            }
+        ],
+        "members": guild_members if intents.members else [],
+        "presences": presences if intents.presences else [],
+    }
+
+
+def create_message_payloads(
+    messages: int, members: int, intents: Intents
+) -> Iterator[Dict[str, Any]]:
+    """Create synthetic MESSAGE_CREATE payloads, sent by the given
+    amount of members.
+    """
+    if not intents.guild_messages:
+        return
+
+    for idx in range(messages):
+        yield {
+            "id": str(GUILD_ID + members + idx + 1),
+            "channel_id": str(GENERAL_CHANNEL_ID),
+            "guild_id": str(GUILD_ID),
+            "author": create_user_payload(idx % max(members, 1)),
+            "content": "lorem ipsum " * 8 if intents.message_content else "",
+            "timestamp": BENCH_TIMESTAMP,
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+        }
+
+
+def measure_cache(
+    client: Client, members: int, messages: int
+) -> Tuple[int, int, int]:
+    """Feed the synthetic payloads to the client and measure the memory
+    held by its cache.
+
+    Returns
+    -------
+    Tuple[:class:`int`, :class:`int`, :class:`int`]
+        The bytes held, and the amount of cached members and messages.
+    """
+    state = client._connection  # type: ignore
+
+    tracemalloc.start()
+    state.parse_guild_create(create_guild_payload(members, client.intents))
+
+    for payload in create_message_payloads(messages, members, client.intents):
+        state.parse_message_create(payload)
+
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cached_members = sum(len(guild.members) for guild in client.guilds)
+    return size, cached_members, len(client.cached_messages)
+
+
+async def run_bot(
+    shard_count: Optional[int] = None,
+    shard_ids: Optional[List[int]] = None,
+    metrics_port: int = METRICS_PORT,
+) -> None:
     humanize.activate("pt_BR")
     token = environ["DISCORD_TOKEN"]
 
-    async with IBot() as bot:
+    async with IBot(
+        shard_count=shard_count,
+        shard_ids=shard_ids,
+        metrics_port=metrics_port,
+    ) as bot:
         await bot.start(token)
 
 
+def run_cluster(shard_count: int, shard_ids: List[int], cluster: int) -> None:
+    # Each cluster serves its own metrics, on the port after the one of
+    # the previous cluster.
+    metrics_port = METRICS_PORT + cluster if METRICS_PORT else 0
+    asyncio.run(run_bot(shard_count, shard_ids, metrics_port))
+
+
+def split_shards(shards: int, clusters: int) -> List[List[int]]:
+    """Split the shards in contiguous ranges, one for each cluster."""
+    return [
+        list(range(idx * shards // clusters, (idx + 1) * shards // clusters))
+        for idx in range(clusters)
+    ]
+
+
 @group()
 def main() -> None:
     pass
 
 
 @main.command()
-def runbot() -> None:
+@option("--shards", type=int, default=None, help="Total amount of shards.")
+@option("--clusters", default=1, help="Processes to split the shards.")
+def runbot(shards: Optional[int], clusters: int) -> None:
     """Run the bot."""
-    asyncio.run(run_bot())
+    if clusters <= 1:
+        return asyncio.run(run_bot(shards))
+
+    if shards is None or shards < clusters:
+        raise UsageError("--shards must be at least --clusters.")
+
+    processes = [
+        Process(
+            target=run_cluster,
+            args=(shards, ids, idx),
+            name=f"cluster-{idx}",
+        )
+        for idx, ids in enumerate(split_shards(shards, clusters))
+    ]
+
+    for process in processes:
+        process.start()
+
+    for process in processes:
+        process.join()
+
+
+def read_avatar(path: Optional[str], size: int) -> bytes:
+    """Read the avatar at the given path, or create a noise avatar of
+    the given size if there is no path.
+    """
+    from PIL import Image
+
+    if path is not None:
+        with open(path, "rb") as f:
+            return f.read()
+
+    # Noise is the worst case for the encoders, so the results are an
+    # upper bound for real avatars.
+    image = Image.merge(
+        "RGB", [Image.effect_noise((size, size), 64) for _ in range(3)]
+    )
+    output = BytesIO()
+    image.save(output, format="PNG")
+
+    return output.getvalue()
+
+
+@main.command()
+@option("--count", default=20, help="Cards rendered with each setting.")
+@option("--avatar", default=None, help="Path of the avatar to use.")
+def benchwelcome(count: int, avatar: Optional[str]) -> None:
+    """Compare the welcome card encoding settings."""
+    data = read_avatar(avatar, 512)
+
+    for format, options in WELCOME_SETTINGS:
+        card = WelcomeCard(
+            "bot/assets/welcome.png", workers=1, format=format, **options
+        )
+
+        start = perf_counter()
+        size = sum(len(card.render(data)) for _ in range(count))
+        elapsed = (perf_counter() - start) / count
+
+        name = " ".join(f"{k}={v}" for k, v in options.items())
+        echo(
+            f"{format:<5} {name:<17} {elapsed * 1000:>8.1f} ms/card "
+            f"{size // count:>9} bytes/card"
+        )
+        card.close()
+
+
+@main.command()
+@option("--members", default=10000, help="Members of the synthetic guild.")
+@option("--messages", default=5000, help="Messages sent in the guild.")
+def benchmemory(members: int, messages: int) -> None:
+    """Compare the memory used by the gateway caches."""
+    extensions = filter_extensions(
+        find_extensions("bot/extensions"),
+        allow=EXTENSIONS_ALLOW,
+        deny=EXTENSIONS_DENY,
+    )
+    declared = get_intents(extensions, profile=DISCORD_INTENTS)
+    profiles = [
+        # The defaults of discord.py, used by the bot before.
+        ("default", Intents.all(), MemberCacheFlags.all(), 1000),
+        (
+            "configured",
+            declared,
+            get_member_cache_flags(DISCORD_MEMBER_CACHE),
+            DISCORD_MAX_MESSAGES or None,
+        ),
+    ]
+
+    for name, intents, member_cache_flags, max_messages in profiles:
+        client = Client(
+            intents=intents,
+            member_cache_flags=member_cache_flags,
+            max_messages=max_messages,
+            chunk_guilds_at_startup=False,
+        )
+        size, cached_members, cached_messages = measure_cache(
+            client, members, messages
+        )
+
+        echo(
+            f"{name:<10} {size / 1024**2:>8.1f} MiB "
+            f"{cached_members:>7} members {cached_messages:>6} messages"
+        )
+
+
+async def measure_instrumentation(calls: int) -> Tuple[float, float]:
+    """Measure the average time of awaiting a listener that does
+    nothing, with and without the instrumentation.
+    """
+
+    async def listener() -> None:
+        pass
+
+    instrumented = Metrics().instrument(listener, "listener")
+    elapsed: List[float] = []
+
+    for func in (listener, instrumented):
+        start = perf_counter()
+
+        for _ in range(calls):
+            await func()
+
+        elapsed.append((perf_counter() - start) / calls)
+
+    return elapsed[0], elapsed[1]
+
+
+@main.command()
+@option("--calls", default=1000000, help="Calls measured.")
+def benchmetrics(calls: int) -> None:
+    """Measure the overhead of timing listeners and commands."""
+    plain, instrumented = asyncio.run(measure_instrumentation(calls))
+
+    echo(f"plain        {plain * 1e6:>8.3f} us/call")
+    echo(f"instrumented {instrumented * 1e6:>8.3f} us/call")
+    echo(f"overhead     {(instrumented - plain) * 1e6:>8.3f} us/call")
+
+
+async def measure_statement(
+    conn: AsyncConnection,
+    build: Callable[[], Any],
+    params: Callable[[int], Any],
+    calls: int,
+) -> Tuple[float, float]:
+    """Measure the average time of executing a statement rebuilt on
+    every call and built once. The calls alternate between the two, so
+    both see the same state of the database.
+    """
+    built = build()
+    statements = [build, lambda: built]
+    elapsed = [0.0, 0.0]
+
+    for idx in range(calls * 2):
+        start = perf_counter()
+        await conn.execute(statements[idx % 2](), params(idx))
+        elapsed[idx % 2] += perf_counter() - start
+
+    return elapsed[0] / calls, elapsed[1] / calls
+
+
+async def measure_statements(
+    calls: int,
+) -> List[Tuple[str, float, float, bool]]:
+    """Measure executing each hot path statement, rebuilt on every call
+    and built once. The writes are never committed, so the database is
+    left untouched.
+    """
+    engine = create_engine()
+    now = datetime.utcnow()
+    results: List[Tuple[str, float, float, bool]] = []
+
+    try:
+        async with engine.connect() as conn:
+            await create_monthly_partitions(
+                conn, DiscordMessage.__tablename__, start=now.date(), months=1
+            )
+
+            for name, build in BUILDERS.items():
+                # Each statement gets a cache of its own, which only
+                # holds a single compiled form if rebuilding the
+                # statement gives the same cache key.
+                cache: Dict[Any, Any] = {}
+                await conn.execution_options(compiled_cache=cache)
+                params = STATEMENT_PARAMS[name]
+
+                rebuilt, reused = await measure_statement(
+                    conn, build, lambda idx: params(idx, now), calls
+                )
+                results.append((name, rebuilt, reused, len(cache) == 1))
+
+            await conn.rollback()
+    finally:
+        await engine.dispose()
+
+    return results
+
+
+def measure_compile(statement: Any, dialect: Any, calls: int) -> float:
+    """Measure the average time of compiling a statement, as done by
+    the first execution of each cache key.
+    """
+    start = perf_counter()
+
+    for _ in range(calls):
+        statement.compile(dialect=dialect)
+
+    return (perf_counter() - start) / calls
+
+
+@main.command()
+@option("--calls", default=1000, help="Calls measured for each statement.")
+def benchstatements(calls: int) -> None:
+    """Compare executing the hot path statements built on every call
+    against reusing the statements built once. This needs the database.
+    """
+    dialect = create_engine().dialect
+    # The inserts are compiled without the columns of their rows, which
+    # SQLAlchemy warns about, but that doesn't change the measurement.
+    simplefilter("ignore", SAWarning)
+
+    for name, rebuilt, reused, cached in asyncio.run(
+        measure_statements(calls)
+    ):
+        compiled = measure_compile(
+            BUILDERS[name](), dialect, max(calls // 10, 1)
+        )
+
+        echo(
+            f"{name:<22} {rebuilt * 1e6:>8.1f} us/call rebuilt "
+            f"{reused * 1e6:>8.1f} us/call reused "
+            f"{(rebuilt - reused) * 1e6:>8.1f} us/call saved "
+            f"{compiled * 1e6:>8.1f} us/compile "
+            f"{'cached' if cached else 'not cached'}"
+        )
+
+
+def get_level_by_loop(curve: LevelCurve, exp: int) -> int:
+    """Get the level from the given experience by walking the curve
+    level by level, as done before the curve was inverted.
+    """
+    level = 0
+
+    while exp >= curve.get_level_exp(level):
+        exp -= curve.get_level_exp(level)
+        level += 1
+
+    return level
+
+
+@main.command()
+@option("--calls", default=100000, help="Calls measured for each level.")
+def benchlevels(calls: int) -> None:
+    """Compare finding the level of an experience value by walking the
+    curve against inverting the sum of the curve.
+    """
+    curve = LevelCurve()
+
+    for level in (1, 10, 50, 100, 500):
+        exp = curve.get_total_exp(level)
+        functions = [
+            lambda: get_level_by_loop(curve, exp),
+            lambda: curve.get_level(exp),
+        ]
+        elapsed: List[float] = []
+
+        for func in functions:
+            start = perf_counter()
+
+            for _ in range(calls):
+                func()
+
+            elapsed.append((perf_counter() - start) / calls)
+
+        echo(
+            f"level {level:<4} {elapsed[0] * 1e6:>8.2f} us/call loop "
+            f"{elapsed[1] * 1e6:>8.2f} us/call inverse"
+        )
+
+
+async def upsert_experience_by_row(
+    conn: AsyncConnection, rows: List[Dict[str, int]]
+) -> None:
+    """Write the experience of many users with one upsert per user, as
+    done before the ``unnest`` upsert was used.
+    """
+    for row in rows:
+        stmt = insert(LevelUser).values(**row)  # type: ignore
+        await conn.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[LevelUser.user_id],
+                set_=dict(exp=stmt.excluded.exp),
+            )
+        )
+
+
+async def upsert_experience_by_unnest(
+    conn: AsyncConnection, rows: List[Dict[str, int]]
+) -> None:
+    params = dict(
+        user_ids=[row["user_id"] for row in rows],
+        exps=[row["exp"] for row in rows],
+    )
+    await conn.execute(UPSERT_EXPERIENCE, params)
+
+
+async def measure_experience_writes(
+    counts: List[int],
+) -> List[Tuple[int, float, float]]:
+    """Measure writing the experience of many users with each upsert.
+    The writes are never committed, so the database is left untouched.
+    """
+    engine = create_engine()
+    results: List[Tuple[int, float, float]] = []
+
+    try:
+        for count in counts:
+            # The IDs are negative so they can't collide with any user.
+            rows = [dict(user_id=-i, exp=i) for i in range(1, count + 1)]
+            elapsed: List[float] = []
+
+            writes = [upsert_experience_by_row, upsert_experience_by_unnest]
+
+            for write in writes:
+                async with engine.connect() as conn:
+                    start = perf_counter()
+                    await write(conn, rows)
+                    elapsed.append(perf_counter() - start)
+                    await conn.rollback()
+
+            results.append((count, elapsed[0], elapsed[1]))
+    finally:
+        await engine.dispose()
+
+    return results
+
+
+@main.command()
+@option("--users", default="10,100,10000", help="User counts to write.")
+def benchexperience(users: str) -> None:
+    """Compare writing the experience of many users with one upsert per
+    user against a single ``unnest`` upsert. This needs the database.
+    """
+    counts = [int(count) for count in users.split(",")]
+    results = asyncio.run(measure_experience_writes(counts))
+
+    for count, by_row, by_unnest in results:
+        echo(
+            f"{count:>6} users {by_row * 1000:>9.1f} ms by row "
+            f"{by_unnest * 1000:>9.1f} ms by unnest "
+            f"{by_row / by_unnest:>7.1f}x"
+        )
+
+
+def measure_calls(func: Callable[[int], Any], args: List[int]) -> float:
+    """Measure the average time of calling a function with each of the
+    given arguments.
+    """
+    start = perf_counter()
+
+    for arg in args:
+        func(arg)
+
+    return (perf_counter() - start) / len(args)
+
+
+@main.command()
+@option("--users", default=100000, help="Users in the ranking.")
+@option("--calls", default=10000, help="Calls measured for each operation.")
+def benchranking(users: int, calls: int) -> None:
+    """Measure the ranking with many users, against counting the users
+    with a higher score, as the database would without the ranking.
+    """
+    rng = random.Random(0)
+    scores = {user_id: rng.randrange(10**6) for user_id in range(users)}
+    user_ids = [rng.randrange(users) for _ in range(calls)]
+    ranking = Ranking()
+
+    start = perf_counter()
+    ranking.load(scores)
+    echo(f"load     {(perf_counter() - start) * 1000:>10.1f} ms")
+
+    def update(user_id: int) -> None:
+        # Awards only ever raise the score a little.
+        scores[user_id] += rng.randint(15, 25)
+        ranking.update(user_id, scores[user_id])
+
+    def count(user_id: int) -> int:
+        score = scores[user_id]
+        return sum(1 for other in scores.values() if other > score) + 1
+
+    operations: List[Tuple[str, Callable[[int], Any], List[int]]] = [
+        ("update", update, user_ids),
+        ("position", ranking.get_position, user_ids),
+        ("page", lambda page: ranking.get_page(page, per_page=10), [1, 100]),
+        ("count", count, user_ids[:100]),
+    ]
+
+    for name, func, args in operations:
+        elapsed = measure_calls(func, args)
+        echo(f"{name:<8} {elapsed * 1e6:>10.2f} us/call")
+
+
+def render_welcome_before(avatar: bytes) -> bytes:
+    """Render a welcome card as done before the cards were rendered by
+    :class:`bot.utils.welcome.WelcomeCard`: the background is decoded
+    for every card, and everything runs on the event loop.
+    """
+    from PIL import Image, ImageDraw
+
+    size = WelcomeCard.size
+    mask = Image.new("L", size, 0)
+    background = Image.new("RGBA", size, 0)
+    ImageDraw.Draw(mask).ellipse((4, 4, size[0] - 4, size[1] - 4), fill=255)
+
+    welcome = Image.open("bot/assets/welcome.png")
+    resized = Image.open(BytesIO(avatar)).resize(size)
+    rounded = Image.composite(resized, background, mask)
+    welcome.paste(rounded, box=WelcomeCard.coords, mask=mask)
+
+    output = BytesIO()
+    welcome.save(output, format="PNG")
+
+    return output.getvalue()
+
+
+async def measure_loop_blocking(
+    render: Callable[[bytes], Awaitable[bytes]], avatar: bytes, joins: int
+) -> Tuple[float, float]:
+    """Measure how long the event loop is blocked while the cards of
+    a burst of joins are rendered, by how late a task that wakes up
+    every millisecond is woken up.
+    """
+    interval = 0.001
+    delays: List[float] = []
+    done = asyncio.Event()
+
+    async def probe() -> None:
+        while not done.is_set():
+            start = perf_counter()
+            await asyncio.sleep(interval)
+            delays.append(max(perf_counter() - start - interval, 0))
+
+    task = asyncio.create_task(probe())
+    await asyncio.sleep(interval)
+    await asyncio.gather(*(render(avatar) for _ in range(joins)))
+    done.set()
+    await task
+
+    return max(delays), sum(delays) / joins
+
+
+@main.command()
+@option("--joins", default=20, help="Members joining at once.")
+@option("--avatar", default=None, help="Path of the avatar to use.")
+def benchjoins(joins: int, avatar: Optional[str]) -> None:
+    """Compare how long the event loop is blocked per join, rendering
+    the welcome cards on the loop as before against rendering them in
+    the thread pool.
+    """
+    card = WelcomeCard(
+        "bot/assets/welcome.png",
+        workers=WELCOME_RENDER_WORKERS,
+        format=WELCOME_FORMAT,
+        quality=WELCOME_QUALITY,
+        compress_level=WELCOME_COMPRESS_LEVEL,
+    )
+
+    async def before(avatar: bytes) -> bytes:
+        # The old listener fetched the full avatar, and rendered it
+        # without ever giving control back to the loop.
+        return render_welcome_before(avatar)
+
+    # Before, the full avatar was fetched, after, the smallest size
+    # that fits the card.
+    renders = [
+        ("before", before, read_avatar(avatar, 1024)),
+        ("after", card.render_async, read_avatar(avatar, card.avatar_size)),
+    ]
+
+    for name, render, data in renders:
+        longest, blocked = asyncio.run(
+            measure_loop_blocking(render, data, joins)
+        )
+        echo(
+            f"{name:<6} {blocked * 1000:>8.1f} ms blocked/join "
+            f"{longest * 1000:>8.1f} ms longest block"
+        )
+
+    card.close()
 
 
 if __name__ == "__main__":
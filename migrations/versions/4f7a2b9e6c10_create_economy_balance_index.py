@@ -0,0 +1,22 @@
+"""create economy balance index
+
+Revision ID: 4f7a2b9e6c10
+Revises: 9c5d0e7b3a41
+Create Date: 2026-10-18 19:52:14.068391
+"""
+
+from alembic.op import create_index, drop_index  # type: ignore
+from sqlalchemy import text
+
+revision = "4f7a2b9e6c10"
+down_revision = "9c5d0e7b3a41"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_index("ix_economy_balance", "economy", [text("balance DESC")])
+
+
+def downgrade() -> None:
+    drop_index("ix_economy_balance", table_name="economy")
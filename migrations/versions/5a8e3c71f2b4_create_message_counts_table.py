@@ -0,0 +1,56 @@
+"""create message counts table
+
+Revision ID: 5a8e3c71f2b4
+Revises: d41f6b2a9c03
+Create Date: 2026-10-18 15:03:11.204617
+"""
+
+from datetime import timedelta
+
+from alembic.op import create_table, drop_table, get_bind  # type: ignore
+from sqlalchemy import BigInteger, Column, Date, PrimaryKeyConstraint, text
+
+revision = "5a8e3c71f2b4"
+down_revision = "d41f6b2a9c03"
+branch_labels = None
+depends_on = None
+
+# The amount of days of messages counted by each backfill statement.
+BATCH_DAYS = 30
+
+
+def upgrade() -> None:
+    create_table(
+        "message_counts",
+        Column("day", Date(), nullable=False),
+        Column("author_id", BigInteger(), nullable=False),
+        Column("count", BigInteger(), nullable=False),
+        PrimaryKeyConstraint("day", "author_id"),
+    )
+
+    conn = get_bind()
+    bounds = conn.execute(
+        text(
+            "SELECT MIN(created_at)::date, MAX(created_at)::date FROM messages"
+        )
+    ).one()
+
+    if bounds[0] is None:
+        return
+
+    start, last = bounds
+    stmt = text(
+        "INSERT INTO message_counts (day, author_id, count) "
+        "SELECT created_at::date, author_id, COUNT(*) FROM messages "
+        "WHERE created_at >= :start AND created_at < :end "
+        "GROUP BY 1, 2"
+    )
+
+    while start <= last:
+        end = start + timedelta(days=BATCH_DAYS)
+        conn.execute(stmt, dict(start=start, end=end))
+        start = end
+
+
+def downgrade() -> None:
+    drop_table("message_counts")
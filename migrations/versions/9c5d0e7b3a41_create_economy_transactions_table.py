@@ -0,0 +1,47 @@
+"""create economy transactions table
+
+Revision ID: 9c5d0e7b3a41
+Revises: e3f19a6c2d87
+Create Date: 2026-10-18 18:41:05.337210
+"""
+
+from alembic.op import create_table, drop_table, execute  # type: ignore
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Identity,
+    PrimaryKeyConstraint,
+    String,
+)
+
+revision = "9c5d0e7b3a41"
+down_revision = "e3f19a6c2d87"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_table(
+        "economy_transactions",
+        Column("transaction_id", BigInteger(), Identity(), nullable=False),
+        Column("sender_id", BigInteger(), nullable=True),
+        Column("receiver_id", BigInteger(), nullable=False),
+        Column("amount", BigInteger(), nullable=False),
+        Column("reason", String(), nullable=False),
+        Column("created_at", DateTime(), nullable=False),
+        PrimaryKeyConstraint("transaction_id"),
+    )
+
+    # The current balances become the first movements, so the ledger
+    # adds up to the balances from the start.
+    execute(
+        "INSERT INTO economy_transactions "
+        "(receiver_id, amount, reason, created_at) "
+        "SELECT user_id, balance, 'initial', timezone('UTC', now()) "
+        "FROM economy WHERE balance <> 0"
+    )
+
+
+def downgrade() -> None:
+    drop_table("economy_transactions")
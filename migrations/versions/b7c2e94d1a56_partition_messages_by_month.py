@@ -0,0 +1,81 @@
+"""partition messages by month
+
+Revision ID: b7c2e94d1a56
+Revises: 5a8e3c71f2b4
+Create Date: 2026-10-18 16:20:48.901352
+"""
+
+from datetime import date, datetime
+
+from alembic.op import execute, get_bind  # type: ignore
+from sqlalchemy import text
+
+revision = "b7c2e94d1a56"
+down_revision = "5a8e3c71f2b4"
+branch_labels = None
+depends_on = None
+
+COLUMNS = """
+    message_id BIGINT NOT NULL,
+    author_id BIGINT NOT NULL,
+    channel_id BIGINT NOT NULL,
+    content VARCHAR NOT NULL,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+"""
+
+
+def next_month(month: date) -> date:
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+
+    return date(month.year, month.month + 1, 1)
+
+
+def upgrade() -> None:
+    execute("ALTER TABLE messages RENAME TO messages_old")
+    execute(
+        "ALTER TABLE messages_old RENAME CONSTRAINT messages_pkey "
+        "TO messages_old_pkey"
+    )
+    execute(
+        f"CREATE TABLE messages ({COLUMNS}, "
+        f"PRIMARY KEY (message_id, created_at)) "
+        f"PARTITION BY RANGE (created_at)"
+    )
+
+    # Partitions are created from the month of the oldest message up to
+    # the month after the current one. The bot creates the next ones.
+    oldest = (
+        get_bind()
+        .execute(text("SELECT MIN(created_at) FROM messages_old"))
+        .scalar()
+    )
+    month = (oldest or datetime.utcnow()).date().replace(day=1)
+    last = next_month(datetime.utcnow().date().replace(day=1))
+
+    while month <= last:
+        end = next_month(month)
+        execute(
+            f"CREATE TABLE messages_y{month.year}m{month.month:02d} "
+            f"PARTITION OF messages FOR VALUES "
+            f"FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        )
+        month = end
+
+    execute(
+        "CREATE INDEX ix_messages_created_at_author_id "
+        "ON messages (created_at, author_id)"
+    )
+    execute("INSERT INTO messages SELECT * FROM messages_old")
+    execute("DROP TABLE messages_old")
+
+
+def downgrade() -> None:
+    execute("ALTER TABLE messages RENAME TO messages_old")
+    execute(
+        "ALTER TABLE messages_old RENAME CONSTRAINT messages_pkey "
+        "TO messages_old_pkey"
+    )
+    execute(f"CREATE TABLE messages ({COLUMNS}, PRIMARY KEY (message_id))")
+    execute("INSERT INTO messages SELECT * FROM messages_old")
+    execute("DROP TABLE messages_old")
@@ -0,0 +1,22 @@
+"""create levels exp index
+
+Revision ID: d41f6b2a9c03
+Revises: 8b004acf7e90
+Create Date: 2026-10-18 14:12:37.518204
+"""
+
+from alembic.op import create_index, drop_index  # type: ignore
+from sqlalchemy import text
+
+revision = "d41f6b2a9c03"
+down_revision = "8b004acf7e90"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_index("ix_levels_exp", "levels", [text("exp DESC")])
+
+
+def downgrade() -> None:
+    drop_index("ix_levels_exp", table_name="levels")
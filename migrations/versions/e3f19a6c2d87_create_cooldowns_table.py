@@ -0,0 +1,34 @@
+"""create cooldowns table
+
+Revision ID: e3f19a6c2d87
+Revises: b7c2e94d1a56
+Create Date: 2026-10-18 17:26:48.913052
+"""
+
+from alembic.op import create_table, drop_table  # type: ignore
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    PrimaryKeyConstraint,
+    String,
+)
+
+revision = "e3f19a6c2d87"
+down_revision = "b7c2e94d1a56"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    create_table(
+        "cooldowns",
+        Column("name", String(), nullable=False),
+        Column("user_id", BigInteger(), nullable=False),
+        Column("claimed_at", DateTime(), nullable=False),
+        PrimaryKeyConstraint("name", "user_id"),
+    )
+
+
+def downgrade() -> None:
+    drop_table("cooldowns")
@@ -0,0 +1,93 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from contextlib import asynccontextmanager
+from os import environ
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional
+
+import pytest
+
+# The database settings are read when the models are imported, so they
+# must be set before anything from the bot is imported. No connection
+# is made unless a test asks for a real database.
+for key, value in {
+    "POSTGRES_USER": "incandescent",
+    "POSTGRES_PASSWORD": "incandescent",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_DB": "incandescent",
+    "BOT_ENV": "development",
+}.items():
+    environ.setdefault(key, value)
+
+
+class FakeResult(list):  # type: ignore
+    """The rows returned by :class:`FakeConnection`."""
+
+    def fetchone(self) -> Any:
+        return self[0] if self else None
+
+    def one(self) -> Any:
+        return self[0]
+
+    def all(self) -> List[Any]:
+        return list(self)
+
+    def tuples(self) -> "FakeResult":
+        return self
+
+
+class FakeConnection:
+    def __init__(self, engine: "FakeEngine") -> None:
+        self.engine = engine
+
+    async def execute(self, statement: Any, params: Any = None) -> Any:
+        self.engine.statements.append((statement, params))
+
+        if self.engine.on_execute is not None:
+            await self.engine.on_execute(statement, params)
+
+        rows = self.engine.results.pop(0) if self.engine.results else []
+        return FakeResult(rows)
+
+
+class FakeEngine:
+    """An engine that doesn't connect to anything. It counts the
+    transactions and records the statements run through it, and returns
+    the rows queued in ``results``, in order.
+    """
+
+    def __init__(self) -> None:
+        self.transactions = 0
+        self.statements: List[Any] = []
+        self.results: List[List[Any]] = []
+        self.on_execute: Optional[Callable[[Any, Any], Awaitable[None]]] = None
+
+    @asynccontextmanager
+    async def begin(self) -> AsyncIterator[FakeConnection]:
+        self.transactions += 1
+        yield FakeConnection(self)
+
+    connect = begin
+
+    async def dispose(self) -> None:
+        pass
+
+
+@pytest.fixture
+def engine() -> FakeEngine:
+    return FakeEngine()
@@ -0,0 +1,70 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from typing import List
+
+import pytest
+
+from bot.utils.batch import BatchWriter
+
+
+def create_writer(failures: int, retries: int) -> BatchWriter[int]:
+    written: List[int] = []
+
+    async def flush(batch: List[int]) -> None:
+        nonlocal failures
+
+        if failures:
+            failures -= 1
+            raise OSError("The database is restarting.")
+
+        written.extend(batch)
+
+    writer = BatchWriter(
+        flush,
+        max_size=10,
+        max_delay=1,
+        max_pending=10,
+        retries=retries,
+        retry_delay=0,
+    )
+    writer.written = written  # type: ignore
+    return writer
+
+
+async def write(writer: BatchWriter[int]) -> List[int]:
+    for item in range(3):
+        await writer.put(item)
+
+    await writer.close()
+    return writer.written  # type: ignore
+
+
+def test_failed_batch_is_retried() -> None:
+    writer = create_writer(failures=2, retries=2)
+
+    assert asyncio.run(write(writer)) == [0, 1, 2]
+
+
+def test_failed_batch_is_given_up_after_retries(
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    writer = create_writer(failures=3, retries=2)
+
+    assert asyncio.run(write(writer)) == []
+    assert "Gave up on a batch of 3 items: [0, 1, 2]" in caplog.text
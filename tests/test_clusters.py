@@ -0,0 +1,270 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from collections import Counter
+from importlib import import_module
+from multiprocessing import get_context
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Set
+from unittest.mock import AsyncMock
+
+import pytest
+from discord import ClientUser, Member
+from discord.ext.commands import Cog  # type: ignore
+
+from bot.core import IBot
+from bot.utils.constants import GUILD_ID
+from bot.utils.extensions import find_extensions
+from manage import (
+    BENCH_TIMESTAMP,
+    create_guild_payload,
+    create_message_payloads,
+    create_user_payload,
+    split_shards,
+)
+from tests.conftest import FakeEngine
+
+# The cogs that keep state about the guild, so only the cluster that
+# owns it may load them, and the cogs loaded by every cluster.
+GUILD_COGS = {"Economy", "Events", "Fun", "Levels"}
+SHARED_COGS = {"Errors", "Jishaku", "Support"}
+
+# The shard and cluster counts checked, from a single process to many
+# processes with several shards each.
+LAYOUTS = [(1, 1), (2, 1), (2, 2), (5, 2), (5, 3), (16, 4), (16, 16)]
+
+# The layouts replayed with a process for each cluster.
+PROCESS_LAYOUTS = [(2, 2), (5, 3)]
+
+# The members in the guild, the messages they send, and the members
+# that join afterwards, in the replayed gateway events.
+MEMBERS = 10
+MESSAGES = 30
+JOINS = 3
+
+
+def create_bot(
+    shard_count: Optional[int], shard_ids: Optional[List[int]]
+) -> Any:
+    shards = SimpleNamespace(shard_count=shard_count, shard_ids=shard_ids)
+    owns_guild = IBot.owns_guild.fget(shards)  # type: ignore
+    return SimpleNamespace(owns_guild=owns_guild, add_cog=AsyncMock())
+
+
+def stub_cogs(monkeypatch: pytest.MonkeyPatch, module: Any) -> None:
+    # The cogs are replaced by their names, so the extensions can be
+    # set up without connecting to anything.
+    for name, value in list(vars(module).items()):
+        if (
+            isinstance(value, type)
+            and issubclass(value, Cog)
+            and value.__module__ == module.__name__
+        ):
+            monkeypatch.setattr(module, name, lambda *a, n=name, **kw: n)
+
+
+def load_cogs(modules: List[Any], bot: Any) -> Set[str]:
+    async def setup() -> None:
+        for module in modules:
+            await module.setup(bot)
+
+    asyncio.run(setup())
+    return {call.args[0] for call in bot.add_cog.call_args_list}
+
+
+@pytest.mark.parametrize("shards, clusters", LAYOUTS)
+def test_shards_are_split_between_clusters(shards: int, clusters: int) -> None:
+    shard_ids = [i for ids in split_shards(shards, clusters) for i in ids]
+
+    assert shard_ids == list(range(shards))
+
+
+@pytest.mark.parametrize("shards, clusters", LAYOUTS)
+def test_only_one_cluster_owns_guild(
+    shards: int, clusters: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    modules = [import_module(ext) for ext in find_extensions("bot/extensions")]
+
+    for module in modules:
+        stub_cogs(monkeypatch, module)
+
+    owners = []
+    guild_shard = (GUILD_ID >> 22) % shards
+
+    for cluster, shard_ids in enumerate(split_shards(shards, clusters)):
+        bot = create_bot(shards, shard_ids)
+        cogs = load_cogs(modules, bot)
+
+        assert bot.owns_guild == (guild_shard in shard_ids)
+
+        if bot.owns_guild:
+            assert cogs == GUILD_COGS | SHARED_COGS
+        else:
+            assert cogs == SHARED_COGS
+
+        if bot.owns_guild:
+            owners.append(cluster)
+
+    assert len(owners) == 1
+
+
+def test_unsharded_bot_owns_guild() -> None:
+    assert create_bot(None, None).owns_guild
+
+
+def create_member_payload(idx: int) -> Dict[str, Any]:
+    """Create a synthetic GUILD_MEMBER_ADD payload."""
+    return {
+        "guild_id": str(GUILD_ID),
+        "user": create_user_payload(idx),
+        "roles": [],
+        "joined_at": BENCH_TIMESTAMP,
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def count_writes(engine: FakeEngine) -> Dict[str, int]:
+    """Count the rows written to each table. The batches are written
+    either as a list of rows, or as a single row of arrays.
+    """
+    writes = Counter[str]()
+
+    for statement, params in engine.statements:
+        if not getattr(statement, "is_dml", False):
+            continue
+
+        if isinstance(params, dict):
+            params = next(iter(params.values()))
+
+        writes[statement.table.name] += len(params)
+
+    return dict(writes)
+
+
+async def wait_for_listeners() -> None:
+    # discord.py runs each listener in a task of its own, and listeners
+    # dispatch events of their own, such as ``regular_message``.
+    while tasks := [
+        task
+        for task in asyncio.all_tasks()
+        if task.get_name().startswith("discord.py: ")
+    ]:
+        await asyncio.wait(tasks)
+
+
+async def feed_gateway(bot: IBot) -> None:
+    """Feed the bot the guild, the messages sent in it and the members
+    that join it, and wait for every listener to finish.
+    """
+    state = bot._connection
+    state.user = ClientUser(state=state, data=create_user_payload(-1))
+    state.parse_guild_create(create_guild_payload(MEMBERS, bot.intents))
+
+    for payload in create_message_payloads(MESSAGES, MEMBERS, bot.intents):
+        state.parse_message_create(payload)
+
+    for idx in range(MEMBERS, MEMBERS + JOINS):
+        state.parse_guild_member_add(create_member_payload(idx))
+
+    await wait_for_listeners()
+
+
+async def replay_gateway(
+    shard_count: int, shard_ids: List[int]
+) -> Dict[str, Any]:
+    """Start a bot for a cluster, without connecting to Discord or to
+    the database, and feed it the gateway events of the guild.
+
+    Returns
+    -------
+    Dict[:class:`str`, Any]
+        The cogs loaded, the rows written to each table, and the members
+        welcomed.
+    """
+    bot = IBot(shard_count=shard_count, shard_ids=shard_ids)
+    bot.engine = engine = FakeEngine()  # type: ignore
+    welcomed: List[int] = []
+
+    async def welcome(members: List[Member]) -> None:
+        welcomed.extend(member.id for member in members)
+
+    async with bot:
+        await bot.setup_hook()
+
+        # The welcomes are recorded instead of sent, and the default
+        # cards aren't downloaded.
+        if events := bot.get_cog("Events"):
+            events.prerender.cancel()  # type: ignore
+            events.welcomes.flush = welcome  # type: ignore
+
+        await feed_gateway(bot)
+        cogs = {type(cog).__name__ for cog in bot.cogs.values()}
+
+        # Unloading the extensions flushes everything still buffered.
+        for extension in reversed(bot.initial_extensions):
+            await bot.unload_extension(extension)
+
+    return dict(cogs=cogs, writes=count_writes(engine), welcomed=welcomed)
+
+
+def run_cluster(shard_count: int, shard_ids: List[int]) -> Dict[str, Any]:
+    return asyncio.run(replay_gateway(shard_count, shard_ids))
+
+
+@pytest.mark.parametrize("shards, clusters", PROCESS_LAYOUTS)
+def test_only_owner_cluster_writes_state(
+    shards: int, clusters: int, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # The settings are read by each process when it starts, so the
+    # processes are spawned rather than forked. Experience is only
+    # awarded outside of the test channel in production.
+    monkeypatch.setenv("BOT_ENV", "production")
+    monkeypatch.setenv("ECONOMY_MESSAGE_REWARD", "1")
+
+    layout = split_shards(shards, clusters)
+    guild_shard = (GUILD_ID >> 22) % shards
+
+    with get_context("spawn").Pool(clusters) as pool:
+        results = pool.starmap(
+            run_cluster, [(shards, shard_ids) for shard_ids in layout]
+        )
+
+    owners = [guild_shard in shard_ids for shard_ids in layout]
+    joined = [
+        int(create_user_payload(idx)["id"])
+        for idx in range(MEMBERS, MEMBERS + JOINS)
+    ]
+
+    assert owners.count(True) == 1
+
+    for owner, result in zip(owners, results):
+        if not owner:
+            assert result == dict(cogs=SHARED_COGS, writes={}, welcomed=[])
+            continue
+
+        assert result["cogs"] == GUILD_COGS | SHARED_COGS
+        assert result["writes"] == {
+            "messages": MESSAGES,
+            "message_counts": MEMBERS,
+            "levels": MEMBERS,
+            "economy": MEMBERS,
+            "economy_transactions": MEMBERS,
+        }
+        assert result["welcomed"] == joined
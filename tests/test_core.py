@@ -0,0 +1,38 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+
+import pytest
+
+from bot.core import IBot
+
+
+def test_close_before_setup() -> None:
+    async def start() -> IBot:
+        # The login fails, so the bot is closed before its setup.
+        with pytest.raises(RuntimeError):
+            async with IBot() as bot:
+                raise RuntimeError
+
+        return bot
+
+    bot = asyncio.run(start())
+
+    assert bot.session.closed
+    assert bot.pool_task.handle is None
+    assert bot.metrics_task.handle is None
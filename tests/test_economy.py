@@ -0,0 +1,96 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from bot.extensions import economy as economy_module
+from bot.extensions.economy import Economy
+from tests.conftest import FakeEngine
+
+
+def create_economy(engine: FakeEngine) -> Economy:
+    return Economy(SimpleNamespace(engine=engine, caches={}))  # type: ignore
+
+
+def test_write_invalidates_cached_balance(engine: FakeEngine) -> None:
+    economy = create_economy(engine)
+    economy.balances.set(1, 10)
+
+    economy.store_balance(1, 50)
+
+    assert economy.balances.get(1) is None
+
+
+def test_read_racing_a_write_is_not_cached(engine: FakeEngine) -> None:
+    economy = create_economy(engine)
+    engine.results = [[SimpleNamespace(balance=10)]]
+
+    async def write_during_read(statement: Any, params: Any) -> None:
+        # Another task commits a write while the read is in flight, so
+        # the balance it read is already stale.
+        economy.store_balance(1, 50)
+
+    engine.on_execute = write_during_read
+
+    assert asyncio.run(economy.get_balance(1)) == 10
+    assert economy.balances.get(1) is None
+
+
+def test_read_is_cached(engine: FakeEngine) -> None:
+    economy = create_economy(engine)
+    engine.results = [[SimpleNamespace(balance=10)]]
+
+    assert asyncio.run(economy.get_balance(1)) == 10
+    assert asyncio.run(economy.get_balance(1)) == 10
+    assert engine.transactions == 1
+
+
+def test_ranking_stays_bounded(
+    engine: FakeEngine, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(economy_module, "ECONOMY_RANKING_SIZE", 3)
+    economy = create_economy(engine)
+    economy.ranking.load({1: 100, 2: 50, 3: 10})
+
+    # Poorer than the last user, so they aren't added.
+    economy.store_balance(4, 5)
+    # Richer than the last user, who is pushed out.
+    economy.store_balance(5, 60)
+
+    assert economy.ranking.get_page(1, per_page=10) == [
+        (1, 100),
+        (5, 60),
+        (2, 50),
+    ]
+    assert economy.ranking.get_position(3) is None
+
+
+def test_grants_lock_rows_in_user_order(engine: FakeEngine) -> None:
+    economy = create_economy(engine)
+    rows = [
+        dict(receiver_id=user_id, amount=amount)
+        for user_id, amount in [(3, 30), (1, 10), (2, 20), (3, 5)]
+    ]
+
+    asyncio.run(economy.write_grants(rows))
+
+    _, params = engine.statements[0]
+    assert params == dict(user_ids=[1, 2, 3], amounts=[10, 20, 35])
@@ -0,0 +1,78 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any, List
+from unittest.mock import AsyncMock
+
+from bot.extensions.events import Events
+from bot.utils.metrics import Metrics
+from tests.conftest import FakeEngine
+
+
+def create_member(user_id: int, avatar: bytes = b"") -> Any:
+    asset = SimpleNamespace(key=f"avatar-{user_id}", read=AsyncMock())
+
+    if avatar:
+        asset.read.return_value = avatar
+    else:
+        asset.read.side_effect = OSError("The avatar couldn't be fetched.")
+
+    asset.replace = lambda **kwargs: asset
+    return SimpleNamespace(
+        id=user_id,
+        mention=f"<@{user_id}>",
+        display_avatar=asset,
+        default_avatar=SimpleNamespace(key="0"),
+    )
+
+
+async def welcome(engine: FakeEngine, members: List[Any]) -> Events:
+    # The cog creates its tasks in the running loop.
+    events = Events(
+        SimpleNamespace(  # type: ignore
+            engine=engine, env="development", metrics=Metrics()
+        )
+    )
+    events.cards.set("0", b"default")
+    events.__dict__["general_channel"] = SimpleNamespace(send=AsyncMock())
+
+    async def render(avatar: bytes) -> bytes:
+        return b"card:" + avatar
+
+    events.card.render_async = render  # type: ignore
+
+    try:
+        await events.send_welcome(members)
+    finally:
+        events.card.close()
+
+    return events
+
+
+def test_failed_card_falls_back_to_default(engine: FakeEngine) -> None:
+    members = [create_member(1, b"one"), create_member(2)]
+    events = asyncio.run(welcome(engine, members))
+
+    files = events.general_channel.send.call_args.kwargs["files"]
+    cards = [file.fp.read() for file in files]
+
+    assert cards == [b"card:one", b"default"]
+    # The card of the default avatar isn't cached for the member, so
+    # their avatar is tried again the next time.
+    assert events.cards.get("avatar-2") is None
@@ -0,0 +1,42 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from bot.utils.extensions import find_extensions
+from bot.utils.intents import get_intents, get_member_cache_flags
+
+
+def test_declared_intents() -> None:
+    extensions = find_extensions("bot/extensions")
+    intents = get_intents(extensions, profile="declared")
+
+    assert intents.voice_states
+    assert intents.members
+    assert not intents.presences
+
+
+def test_voice_intents_are_only_requested_by_jishaku() -> None:
+    extensions = [
+        extension
+        for extension in find_extensions("bot/extensions")
+        if extension != "bot.extensions.jishaku"
+    ]
+
+    assert not get_intents(extensions, profile="declared").voice_states
+
+
+def test_voice_member_cache() -> None:
+    assert get_member_cache_flags("voice,joined").voice
@@ -0,0 +1,57 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from bot.core import LOOP_LAG
+from bot.extensions.jishaku import MAX_LENGTH, DiagnosticsFeature, codeblock
+from bot.utils.metrics import Metrics
+
+
+def test_metrics_shows_slowest_handlers() -> None:
+    metrics = Metrics()
+
+    for idx in range(200):
+        metrics.get(f"listener Cog.on_event_{idx:03}").observe(idx / 1000)
+
+    ctx = SimpleNamespace(bot=SimpleNamespace(metrics=metrics))
+    ctx.reply = AsyncMock()
+    command = DiagnosticsFeature.jsk_metrics.callback
+    asyncio.run(command(None, ctx, 5))
+
+    (content,), _ = ctx.reply.call_args
+    names = [line.split(":")[0] for line in content.splitlines()[1:-1]]
+
+    assert names == [LOOP_LAG] + [
+        f"listener Cog.on_event_{idx:03}" for idx in range(199, 194, -1)
+    ]
+
+
+def test_codeblock_is_closed_when_truncated() -> None:
+    lines = [f"{idx}: " + "x" * 100 for idx in range(100)]
+    content = codeblock(lines)
+
+    assert len(content) <= MAX_LENGTH
+    assert content.startswith("```\n0: ")
+    assert content.endswith("\n...\n```")
+
+
+def test_codeblock_keeps_short_output() -> None:
+    assert codeblock(["a", "b"]) == "```\na\nb\n```"
+    assert codeblock([]) == "```\n-\n```"
@@ -0,0 +1,231 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from random import randint
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Set, Tuple
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert  # type: ignore
+
+from bot.extensions import levels as module
+from bot.extensions.levels import Levels
+from bot.utils.cooldowns import CooldownStore, MemoryCooldownStore
+from bot.utils.database import LevelUser
+from bot.utils.levels import LevelCurve
+from bot.utils.metrics import Metrics
+from tests.conftest import FakeEngine
+
+
+def get_level_by_loop(exp: int) -> int:
+    """The previous implementation, which walks the curve level by
+    level.
+    """
+    curve = LevelCurve()
+    level = 0
+
+    while exp >= curve.get_level_exp(level):
+        exp -= curve.get_level_exp(level)
+        level += 1
+
+    return level
+
+
+def create_levels(engine: FakeEngine) -> Levels:
+    bot = SimpleNamespace(engine=engine, env="production", metrics=Metrics())
+    cog = Levels(bot)  # type: ignore
+    cog.mapping = {}
+    return cog
+
+
+def create_message(user_id: int) -> Any:
+    author = SimpleNamespace(id=user_id, mention=f"<@{user_id}>")
+    return SimpleNamespace(
+        author=author, channel=SimpleNamespace(id=1), reply=AsyncMock()
+    )
+
+
+def upsert_experience(user_id: int, to_add: int) -> Any:
+    stmt = insert(LevelUser).values(user_id=user_id, exp=to_add)
+    return stmt.on_conflict_do_update(
+        index_elements=[LevelUser.user_id],
+        set_=dict(exp=LevelUser.exp + to_add),
+    ).returning(LevelUser.exp)
+
+
+async def award_before(
+    engine: FakeEngine, cooldown: CooldownStore, users: Set[int], user_id: int
+) -> None:
+    """The database work of the listener before the cooldown was
+    checked first: the experience of the author was read, and the
+    author inserted if they were new, before the cooldown was checked.
+    """
+    async with engine.begin() as conn:
+        await conn.execute(
+            select(LevelUser).where(LevelUser.user_id == user_id)
+        )
+
+    if user_id not in users:
+        users.add(user_id)
+
+        async with engine.begin() as conn:
+            await conn.execute(insert(LevelUser).values(user_id=user_id))
+
+    if await cooldown.acquire(user_id) is not None:
+        return
+
+    async with engine.begin() as conn:
+        await conn.execute(upsert_experience(user_id, randint(15, 25)))
+
+
+async def award_after(
+    engine: FakeEngine, cooldown: CooldownStore, users: Set[int], user_id: int
+) -> None:
+    """The database work of the listener once the cooldown was checked
+    first, and the award was a single upsert.
+    """
+    if await cooldown.acquire(user_id) is not None:
+        return
+
+    async with engine.begin() as conn:
+        await conn.execute(upsert_experience(user_id, randint(15, 25)))
+
+
+async def send_messages(
+    send: Callable[[int], Awaitable[None]],
+    clock: Dict[str, float],
+    messages: int,
+    users: int,
+) -> None:
+    for idx in range(messages):
+        # A message every 0.6 seconds, so every user gets past the
+        # cooldown once a minute.
+        clock["now"] = idx * 0.6
+        await send(idx % users)
+
+
+async def count_transactions(
+    path: str, clock: Dict[str, float]
+) -> Tuple[int, int]:
+    engine = FakeEngine()
+
+    if path == "store":
+        cog = create_levels(engine)
+
+        async def send(user_id: int) -> None:
+            await cog.on_regular_message(create_message(user_id))
+
+        await send_messages(send, clock, messages=1000, users=20)
+        await cog.store.flush()
+
+        return engine.transactions, len(cog.store.exp)
+
+    award = award_before if path == "before" else award_after
+    cooldown = MemoryCooldownStore(60, sweep_interval=60)
+    users: Set[int] = set()
+
+    async def send(user_id: int) -> None:
+        await award(engine, cooldown, users, user_id)
+
+    await send_messages(send, clock, messages=1000, users=20)
+    awards = sum(
+        1 for statement, _ in engine.statements if statement.is_insert
+    )
+
+    return engine.transactions, awards
+
+
+def test_transactions_per_thousand_messages(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    clock = {"now": 0.0}
+    monkeypatch.setattr("bot.utils.cooldowns.monotonic", lambda: clock["now"])
+    monkeypatch.setattr(module, "create_embed", lambda *a, **kw: None)
+
+    before, _ = asyncio.run(count_transactions("before", clock))
+    after, awards = asyncio.run(count_transactions("after", clock))
+    stored, _ = asyncio.run(count_transactions("store", clock))
+
+    # Every message read its author, the first message of each author
+    # inserted them, and every award was an upsert.
+    assert before == 1000 + 20 + 200
+    # Checking the cooldown first leaves only the awards, 10 for each
+    # of the 20 users, each a single upsert.
+    assert (after, awards) == (200, 200)
+    # With the experience store, the awards are written in one flush.
+    assert stored == 1
+
+
+def test_messages_on_cooldown_cost_nothing(engine: FakeEngine) -> None:
+    cog = create_levels(engine)
+
+    async def send() -> None:
+        for _ in range(1000):
+            await cog.on_regular_message(create_message(1))
+
+    asyncio.run(send())
+
+    assert cog.store.get(1) > 0
+    assert cog.bot.metrics.counters["experience awards"] == 1
+    assert engine.transactions == 0
+
+
+def test_curve_matches_loop_on_boundaries() -> None:
+    curve = LevelCurve()
+
+    for level in range(200):
+        total = curve.get_total_exp(level)
+
+        for exp in (total - 1, total, total + 1):
+            assert curve.get_level(exp) == get_level_by_loop(exp)
+
+
+@pytest.mark.parametrize("exp", [0, -1, -100, 99, 100, 12345, 10**7])
+def test_curve_matches_loop(exp: int) -> None:
+    assert LevelCurve().get_level(exp) == get_level_by_loop(exp)
+
+
+def test_curve_totals_match_sum() -> None:
+    curve = LevelCurve()
+    total = 0
+
+    for level in range(1000):
+        assert curve.get_total_exp(level) == total
+        total += curve.get_level_exp(level)
+
+
+# Levels far beyond what the loop can reach, up to the largest
+# experience a BIGINT column holds.
+@pytest.mark.parametrize("level", [10**4, 10**5, 10**6, 1768802])
+def test_curve_matches_totals_on_large_levels(level: int) -> None:
+    curve = LevelCurve()
+    total = curve.get_total_exp(level)
+
+    assert curve.get_level(total - 1) == level - 1
+    assert curve.get_level(total) == level
+    assert curve.get_level(curve.get_total_exp(level + 1) - 1) == level
+
+
+def test_curve_handles_largest_bigint() -> None:
+    curve = LevelCurve()
+    exp = 2**63 - 1
+    level = curve.get_level(exp)
+
+    assert curve.get_total_exp(level) <= exp < curve.get_total_exp(level + 1)
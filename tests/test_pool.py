@@ -0,0 +1,78 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from typing import Any, Callable
+
+import pytest
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.util import greenlet_spawn
+
+from bot.utils.pool import InstrumentedPool
+
+
+class FakeDBAPIConnection:
+    def close(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+
+def create_pool() -> InstrumentedPool:
+    return InstrumentedPool(
+        FakeDBAPIConnection, pool_size=1, max_overflow=0, timeout=0.01
+    )
+
+
+def run(func: Callable[[], Any]) -> Any:
+    # The async pool must be used from a greenlet, as the engine does.
+    return asyncio.run(greenlet_spawn(func))
+
+
+def test_pool_counts_checkouts_and_waits() -> None:
+    pool = create_pool()
+
+    def checkout() -> None:
+        conn = pool.connect()
+
+        with pytest.raises(TimeoutError):
+            pool.connect()
+
+        conn.close()
+        pool.connect().close()
+
+    run(checkout)
+    stats = pool.get_stats()
+
+    assert stats["checkouts"] == 2
+    assert stats["connects"] == 1
+    assert stats["waits"] == 1
+    assert stats["max_in_use"] == 1
+    assert stats["in_use"] == 0
+    assert stats["max_checkout_ms"] >= 10
+
+
+def test_recreated_pool_starts_over() -> None:
+    pool = create_pool()
+    run(lambda: pool.connect().close())
+
+    new = pool.recreate()
+    run(lambda: new.connect().close())
+
+    assert pool.get_stats()["checkouts"] == 1
+    assert new.get_stats()["checkouts"] == 1
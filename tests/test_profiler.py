@@ -0,0 +1,101 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from bot.utils import profiler
+from bot.utils.metrics import Histogram
+from bot.utils.profiler import QueryProfiler, fingerprint
+
+
+def create_profiler() -> QueryProfiler:
+    return QueryProfiler(Histogram(), slow_threshold=0)
+
+
+def run(profiler: QueryProfiler, statement: str) -> Any:
+    context = SimpleNamespace()
+    profiler.before_cursor_execute(None, None, statement, {}, context, False)
+    profiler.after_cursor_execute(None, None, statement, {}, context, False)
+    return context
+
+
+def fail(profiler: QueryProfiler, statement: str, context: Any) -> None:
+    exception_context = SimpleNamespace(
+        statement=statement, execution_context=context
+    )
+    profiler.handle_error(exception_context)
+
+
+def test_batches_of_any_size_share_a_fingerprint() -> None:
+    statements = [
+        "INSERT INTO t (a, b) VALUES "
+        + ", ".join(
+            f"(${i * 2 + 1}::BIGINT, ${i * 2 + 2}::VARCHAR)"
+            for i in range(rows)
+        )
+        for rows in (1, 2, 50)
+    ]
+
+    fingerprints = {fingerprint(statement)[1] for statement in statements}
+
+    assert fingerprints == {"INSERT INTO t (a, b) VALUES (...)"}
+
+
+def test_fingerprints_are_capped(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(profiler, "MAX_FINGERPRINTS", 3)
+    query_profiler = create_profiler()
+
+    for idx in range(10):
+        run(query_profiler, f"SELECT * FROM table_{'x' * idx}")
+
+    assert len(query_profiler.queries) == 4
+    assert query_profiler.queries[profiler.OVERFLOW_KEY].count == 7
+
+
+def test_errors_while_executing_are_recorded() -> None:
+    query_profiler = create_profiler()
+    context = SimpleNamespace()
+
+    query_profiler.before_cursor_execute(
+        None, None, "SELECT ?", {}, context, False
+    )
+    fail(query_profiler, "SELECT ?", context)
+
+    (stats,) = query_profiler.queries.values()
+    assert (stats.count, stats.errors) == (1, 1)
+
+
+def test_errors_while_fetching_are_counted_once() -> None:
+    query_profiler = create_profiler()
+    context = run(query_profiler, "SELECT ?")
+
+    fail(query_profiler, "SELECT ?", context)
+
+    (stats,) = query_profiler.queries.values()
+    assert (stats.count, stats.errors) == (1, 1)
+    assert query_profiler.histogram.errors == 1
+
+
+def test_errors_before_executing_are_ignored() -> None:
+    query_profiler = create_profiler()
+
+    fail(query_profiler, "SELECT ?", None)
+
+    assert not query_profiler.queries
@@ -0,0 +1,58 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import random
+
+from bot.utils.ranking import Ranking
+
+
+def test_ranking_matches_sorted_scores() -> None:
+    rng = random.Random(0)
+    ranking = Ranking()
+    ranking.load({user_id: rng.randrange(100) for user_id in range(50)})
+    scores = dict(ranking.scores)
+
+    for _ in range(2000):
+        user_id = rng.randrange(60)
+
+        if rng.random() < 0.1:
+            ranking.remove(user_id)
+            scores.pop(user_id, None)
+        else:
+            # Scores go up and down, by a little or a lot, and users
+            # outside the ranking are added to it.
+            score = max(scores.get(user_id, 0) + rng.randint(-30, 30), 0)
+            ranking.update(user_id, score)
+            scores[user_id] = score
+
+        expected = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+        assert ranking.get_page(1, per_page=len(scores)) == expected
+
+    for position, (user_id, _) in enumerate(expected, 1):
+        assert ranking.get_position(user_id) == position
+
+
+def test_trim_keeps_the_highest_scores() -> None:
+    ranking = Ranking()
+    ranking.load({1: 10, 2: 30, 3: 20, 4: 30})
+
+    ranking.trim(2)
+
+    assert ranking.get_page(1, per_page=10) == [(2, 30), (4, 30)]
+    assert ranking.get_position(3) is None
+    assert len(ranking) == 2
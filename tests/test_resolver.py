@@ -0,0 +1,59 @@
+"""
+Copyright (C) 2023  kyomi
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+from unittest.mock import AsyncMock, Mock
+
+from discord import NotFound
+
+from bot.utils.resolver import UserResolver
+
+
+def create_resolver(fetch_user: Any, max_size: int = 10) -> UserResolver:
+    bot = SimpleNamespace(
+        guild=SimpleNamespace(get_member=lambda user_id: None),
+        get_user=lambda user_id: None,
+        fetch_user=fetch_user,
+    )
+    return UserResolver(bot, ttl=60, max_size=max_size, concurrency=2)
+
+
+def test_deleted_accounts_are_cached() -> None:
+    response = Mock(status=404, reason="Not Found")
+    fetch_user = AsyncMock(side_effect=NotFound(response, "Unknown User"))
+    resolver = create_resolver(fetch_user)
+
+    async def resolve() -> None:
+        assert await resolver.resolve(1) is None
+        assert await resolver.resolve(1) is None
+
+    asyncio.run(resolve())
+
+    assert fetch_user.await_count == 1
+    assert (resolver.users.hits, resolver.users.misses) == (1, 1)
+
+
+def test_fetched_users_are_bounded() -> None:
+    fetch_user = AsyncMock(side_effect=lambda user_id: f"user {user_id}")
+    resolver = create_resolver(fetch_user, max_size=3)
+
+    users = asyncio.run(resolver.resolve_many(range(5)))
+
+    assert users == {i: f"user {i}" for i in range(5)}
+    assert list(resolver.users.entries) == [2, 3, 4]